@@ -1,18 +1,41 @@
 import tkinter as tk
 from tkinter import messagebox
-import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from joke_core import (AliasTable, JokeDeck, JokeFileWatcher, JokeIndex, JokeWeights, joke_deck_path,
+                       joke_weights_path, open_joke_corpus)
+
+WATCH_MS = 2000  # How often randomJokes.txt is checked for changes
+RELOAD_POLL_MS = 100  # How often a background reload is checked for completion
 
 class JokeTellingAssistant:
     
-    def __init__(self, root):
+    def __init__(self, root, mapped=False):
         self.root = root
+        self.mapped = mapped  # Memory-map the joke file instead of reading it all in
         self.root.title("Alexa - Joke Teller")
         self.root.geometry("900x600")  # Reduced window size
         self.root.resizable(False, False)  # Prevent resizing to maintain layout
         
-        # Load jokes from file into a list
+        # Load jokes from file, split into setup and punchline once up front
         self.jokes = self.load_jokes()
-        self.current_joke = None  # Will hold the currently selected joke string
+        # Shuffled order to tell them in, carried on from the last run if the corpus still fits
+        self.deck_path = joke_deck_path('randomJokes.txt')
+        self.deck = JokeDeck.load(self.deck_path, self.jokes)
+        # Thumbs up/down weights, also carried on; once anyone has voted jokes are drawn by weight
+        self.weights_path = joke_weights_path('randomJokes.txt')
+        self.weights = JokeWeights.load(self.weights_path, self.jokes)
+        self.rebuilding_weights = False
+        
+        # Watch the joke file; changes are read on a worker thread and swapped in on the Tk thread
+        self.watcher = JokeFileWatcher('randomJokes.txt', self.jokes)
+        self.reload_executor = ThreadPoolExecutor(max_workers=1)
+        self.reloading = False
+        self.topics = None  # Word -> jokes index for "joke about...", built on the worker thread
+        self.indexed_jokes = 0  # How many jokes topics covers
+        self.indexing = 0  # Index builds in flight
+        self.current_id = None  # Id of the current joke, for votes
+        self.current_joke = None  # Will hold the currently selected Joke record
         self.current_setup = ""   # Setup part of the current joke
         self.current_punchline = ""  # Punchline part of the current joke
         
@@ -27,11 +50,104 @@ class JokeTellingAssistant:
         
         # Create and place all GUI widgets
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)  # Save the deck however the app is closed
+        self.root.after(WATCH_MS, self.watch_jokes)
+        if not self.mapped:
+            self.index_jokes()  # Mapped mode keeps memory flat and waits for the first "Joke About..."
+        self.schedule_weights()
         
     def load_jokes(self):
-        with open('randomJokes.txt', 'r', encoding='utf-8') as file:
-            jokes = [line.strip() for line in file if line.strip()]  # Strip and filter non-empty lines
-        return jokes
+        # Cleaned, deduplicated jokes from compile_jokes.py if they still match the file,
+        # otherwise its non-empty lines (memory-mapped if asked), parsed and indexed by id
+        return open_joke_corpus('randomJokes.txt', self.mapped)
+    
+    def watch_jokes(self):
+        # One os.stat per poll; only an append or rewrite starts any reading
+        if not self.reloading:
+            change = self.watcher.check()
+            if change:
+                self.reloading = True
+                # An append parses just the new tail; anything else re-reads the whole file
+                task = self.jokes.appended if change == 'append' else self.load_jokes
+                future = self.reload_executor.submit(task)
+                self.root.after(RELOAD_POLL_MS, self.finish_reload, change, future)
+        self.root.after(WATCH_MS, self.watch_jokes)
+    
+    def index_jokes(self, appended=False):
+        # Indexing a large corpus takes a while, so it runs on the worker thread like a reload.
+        # After an append only the jokes the current index does not cover yet are read
+        if appended and self.topics is not None:
+            future = self.reload_executor.submit(self.topics.extended, self.jokes, self.indexed_jokes)
+        else:
+            future = self.reload_executor.submit(JokeIndex.build, self.jokes)
+        self.indexing += 1
+        self.root.after(RELOAD_POLL_MS, self.finish_index, self.jokes, future)
+    
+    def finish_index(self, jokes, future):
+        if not future.done():
+            self.root.after(RELOAD_POLL_MS, self.finish_index, jokes, future)
+            return
+        self.indexing -= 1
+        if jokes is not self.jokes:
+            return  # The jokes were reloaded meanwhile; their own index is on its way
+        try:
+            self.topics = future.result()
+            self.indexed_jokes = len(jokes)
+        except (OSError, ValueError) as e:
+            self.status_label.config(text=f"⚠️ Could not index jokes: {e}")
+    
+    def schedule_weights(self):
+        # The alias table is only rebuilt after a batch of votes, from a snapshot on the worker thread;
+        # draws stay in proportion to the latest weights meanwhile
+        if self.weights.votes and self.weights.needs_rebuild() and not self.rebuilding_weights:
+            self.rebuilding_weights = True
+            generation, weights = self.weights.snapshot()
+            future = self.reload_executor.submit(AliasTable.build, weights)
+            self.root.after(RELOAD_POLL_MS, self.finish_weights, future, generation)
+    
+    def finish_weights(self, future, generation):
+        if not future.done():
+            self.root.after(RELOAD_POLL_MS, self.finish_weights, future, generation)
+            return
+        self.rebuilding_weights = False
+        self.weights.install(future.result(), generation)  # Ignored if the jokes were reloaded meanwhile
+        self.schedule_weights()  # In case the jokes were reloaded or many votes came in meanwhile
+    
+    def finish_reload(self, change, future):
+        if not future.done():
+            self.root.after(RELOAD_POLL_MS, self.finish_reload, change, future)
+            return
+        
+        self.reloading = False
+        try:
+            jokes = future.result()
+        except (OSError, ValueError) as e:  # ValueError: bad UTF-8 in the new text
+            self.status_label.config(text=f"⚠️ Could not reload jokes: {e}")
+            return
+        
+        # Swap the whole corpus in one assignment so a joke is never read from a half-built one
+        old_jokes, self.jokes = self.jokes, jokes
+        added = len(jokes) - len(old_jokes)
+        old_jokes.close()
+        self.watcher.watch(jokes)
+        if change == 'append':
+            self.deck.resize(len(jokes))  # New jokes join the rest of the current deck
+            self.weights.resize(len(jokes))  # ...and start at weight 1
+        else:
+            self.deck.reset(len(jokes))  # Ids now point at different jokes
+            self.weights.reset(len(jokes))  # So the votes no longer apply
+            self.current_id = None  # Nor to the joke on screen, which may be gone or renumbered
+            self.up_btn.config(state='disabled')
+            self.down_btn.config(state='disabled')
+            self.topics = None  # Nor does the old index; "joke about..." waits for the new one
+        if not self.mapped or self.topics is not None:
+            self.index_jokes(change == 'append')
+        self.schedule_weights()
+        
+        if change == 'append':
+            self.status_label.config(text=f"📚 {added} new jokes added - {len(jokes)} jokes loaded")
+        else:
+            self.status_label.config(text=f"📚 Joke file changed - reloaded {len(jokes)} jokes")
     
     def create_widgets(self):
         # Main title label - Centered and prominent
@@ -118,6 +234,31 @@ class JokeTellingAssistant:
         )
         self.punchline_btn.grid(row=0, column=1, padx=10, pady=8)
         
+        # Thumbs up/down beside the punchline button, enabled once the punchline is shown
+        self.vote_frame = tk.Frame(self.button_frame, bg=self.bg_color)
+        self.vote_frame.grid(row=0, column=2, padx=5, pady=8)
+        vote_style = dict(button_style, width=3)  # Narrow, just the emoji
+        self.up_btn = tk.Button(
+            self.vote_frame,
+            text="👍",
+            command=lambda: self.vote(True),  # More jokes like this
+            bg="#28a745",  # Green color
+            fg="white",
+            state='disabled',
+            **vote_style
+        )
+        self.up_btn.pack(side='left', padx=3)
+        self.down_btn = tk.Button(
+            self.vote_frame,
+            text="👎",
+            command=lambda: self.vote(False),  # Fewer jokes like this
+            bg="#6c757d",  # Grey color
+            fg="white",
+            state='disabled',
+            **vote_style
+        )
+        self.down_btn.pack(side='left', padx=3)
+        
         # Button to get the next joke (initially disabled)
         self.next_joke_btn = tk.Button(
             self.button_frame,
@@ -141,6 +282,27 @@ class JokeTellingAssistant:
         )
         self.quit_btn.grid(row=1, column=1, padx=10, pady=8)
         
+        # Entry for a word to find a joke about, e.g. "chicken" (Enter works too)
+        self.topic_entry = tk.Entry(
+            self.button_frame,
+            font=("Arial", 12),
+            width=17,
+            justify='center'
+        )
+        self.topic_entry.grid(row=2, column=0, padx=10, pady=8)
+        self.topic_entry.bind('<Return>', lambda event: self.topic_btn.invoke())  # Does nothing while disabled
+        
+        # Button to tell a joke about the word in the entry
+        self.topic_btn = tk.Button(
+            self.button_frame,
+            text="🔎 Joke About...",
+            command=self.tell_joke_about,  # Calls tell_joke_about method
+            bg="#6f42c1",  # Purple color
+            fg="white",
+            **button_style
+        )
+        self.topic_btn.grid(row=2, column=1, padx=10, pady=8)
+        
         # Status label at the bottom to show app state or messages
         self.status_label = tk.Label(
             self.root,
@@ -154,26 +316,48 @@ class JokeTellingAssistant:
         # Configure grid weights for centering
         self.button_frame.grid_columnconfigure(0, weight=1)
         self.button_frame.grid_columnconfigure(1, weight=1)
+        self.button_frame.grid_columnconfigure(2, weight=1)
         self.button_frame.grid_rowconfigure(0, weight=1)
         self.button_frame.grid_rowconfigure(1, weight=1)
+        self.button_frame.grid_rowconfigure(2, weight=1)
     
     def tell_joke(self):
         if not self.jokes:
             messagebox.showerror("Error", "No jokes available!")  # Error if no jokes loaded
             return
         
-        # Select a random joke from the list
-        self.current_joke = random.choice(self.jokes)
-        
-        # Split the joke into setup and punchline based on the first '?'
-        if '?' in self.current_joke:
-            parts = self.current_joke.split('?', 1)  # Split only on first '?'
-            self.current_setup = parts[0] + "?"  # Include the '?' in setup
-            self.current_punchline = parts[1] if len(parts) > 1 else ""  # Punchline after '?'
+        # Once anyone has voted, favour the jokes people liked (O(1) per draw from the alias table,
+        # skipping the last few told); until then draw the next joke of the shuffled deck
+        # (no repeats until every joke has been told)
+        if self.weights.votes and self.weights.table is not None:
+            self.present_joke(self.weights.sample())
         else:
-            # Fallback if no '?' found (treat whole as setup)
-            self.current_setup = self.current_joke
-            self.current_punchline = "(Punchline not available)"
+            self.present_joke(self.deck.draw())
+    
+    def tell_joke_about(self):
+        topic = self.topic_entry.get().strip()
+        if not topic:
+            messagebox.showwarning("Warning", "Type a word to find a joke about, e.g. chicken.")
+            return
+        if self.topics is None:
+            if not self.indexing:
+                self.index_jokes()  # Mapped mode builds the index on first use
+            messagebox.showinfo("Info", "Still indexing the jokes - try again in a moment.")
+            return
+        
+        # A random joke from the posting list of every joke using the word(s)
+        joke_id = self.topics.random_id(topic)
+        if joke_id is None:
+            messagebox.showinfo("Info", f"No jokes about '{topic}' - try another word.")
+            return
+        self.present_joke(joke_id)
+    
+    def present_joke(self, joke_id):
+        # The joke was already split into setup and punchline when loaded
+        self.current_id = joke_id
+        self.current_joke = self.jokes[joke_id]
+        self.current_setup = self.current_joke.setup
+        self.current_punchline = self.current_joke.punchline
         
         # Update the setup label with the setup text
         self.setup_label.config(text=self.current_setup)
@@ -183,6 +367,9 @@ class JokeTellingAssistant:
         self.punchline_btn.config(state='normal')
         self.next_joke_btn.config(state='normal')
         self.tell_joke_btn.config(state='disabled')
+        self.topic_btn.config(state='disabled')
+        self.up_btn.config(state='disabled')
+        self.down_btn.config(state='disabled')
         
         # Update status to prompt user for next action
         self.status_label.config(text="🎭 Joke ready! Click 'Show Punchline' for the funny part!")
@@ -191,10 +378,25 @@ class JokeTellingAssistant:
         if self.current_punchline:
             self.punchline_label.config(text=self.current_punchline)  # Show punchline
             self.punchline_btn.config(state='disabled')  # Disable button after use
+            self.up_btn.config(state='normal')  # Now it can be judged
+            self.down_btn.config(state='normal')
             self.status_label.config(text="😄 Hope that made you smile! Try another joke?")
         else:
             messagebox.showinfo("Info", "No punchline available for this joke.")  # Info if no punchline
     
+    def vote(self, up):
+        if self.current_id is None:
+            return  # The jokes were reloaded since this one was told
+        # Only this joke's weight changes; the alias table catches up in batches
+        self.weights.vote(self.current_id, up)
+        self.up_btn.config(state='disabled')  # One vote per telling
+        self.down_btn.config(state='disabled')
+        if up:
+            self.status_label.config(text="👍 Thanks! You'll hear jokes like that more often.")
+        else:
+            self.status_label.config(text="👎 Noted - that one will come up less often.")
+        self.schedule_weights()
+    
     def next_joke(self):
         # Reset labels to indicate loading/next action
         self.setup_label.config(text="🔄 Getting another joke...")
@@ -202,8 +404,11 @@ class JokeTellingAssistant:
         
         # Reset button states: enable tell joke, disable others
         self.tell_joke_btn.config(state='normal')
+        self.topic_btn.config(state='normal')
         self.punchline_btn.config(state='disabled')
         self.next_joke_btn.config(state='disabled')
+        self.up_btn.config(state='disabled')
+        self.down_btn.config(state='disabled')
         
         # Update status
         self.status_label.config(text="🔄 Ready for another joke!")
@@ -213,11 +418,21 @@ class JokeTellingAssistant:
     
     def quit_app(self):
         # Removed confirmation message box - quit immediately
+        self.reload_executor.shutdown(wait=False)
+        try:
+            self.deck.save(self.deck_path, self.jokes)  # So the next run carries on with the same deck
+        except OSError:
+            pass  # Losing the deck position only means the next run starts a new shuffle
+        try:
+            self.weights.save(self.weights_path, self.jokes)  # Votes count across restarts
+        except OSError:
+            messagebox.showerror("Error", "Could not save the joke votes.")
         self.root.quit()
 
 def main():
     root = tk.Tk()  # Create root window
-    app = JokeTellingAssistant(root)  # Instantiate the app
+    mapped = '--mapped' in sys.argv[1:]  # Memory-mapped joke file for very large corpora
+    app = JokeTellingAssistant(root, mapped=mapped)  # Instantiate the app
     root.mainloop()  # Start the Tkinter event loop
 
 if __name__ == "__main__":
@@ -1,9 +1,17 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import os
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import tkinter.font as tkfont
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from student_core import (CodeIndex, SearchIndex, StudentColumns, StudentDatabase, apply_change, format_statistics,
+                          validate_student)
+
+RECORD_LINES = 7  # Lines format_student_output uses per student, separator included
+IO_POLL_MS = 50  # How often the Tk thread checks whether background file I/O has finished
+SEARCH_LIMIT = 50  # Matches listed per keystroke in the student search boxes
 
 class StudentManager:
-    def __init__(self, root):
+    def __init__(self, root, compact=False, journal=False, snapshot=False, sqlite=False):
         self.root = root
         self.root.title("Student Manager")
         self.root.geometry("800x600")
@@ -11,90 +19,231 @@ class StudentManager:
         # Apply blueish color theme
         self.root.configure(bg='#e6f2ff')
         
-        # Data storage
-        self.students = []
+        # Data storage, indexes and persistence live in student_core so they also work headlessly
         self.filename = "studentMarks.txt"
+        self.db_options = {'compact': compact, 'journal': journal, 'snapshot': snapshot, 'sqlite': sqlite}
+        self.db = StudentDatabase(self.filename, **self.db_options)
         
-        # Load data
-        self.load_data()
+        # File I/O runs on one worker thread (so writes stay in order) and reports back via root.after
+        self.io_executor = ThreadPoolExecutor(max_workers=1)
+        self.pending_io = 0
+        
+        # Record list currently shown in the results area; only the rows in view are formatted
+        self.view_rows = None
+        self.view_first = 0
+        
+        # Open batch edit (a StudentTransaction): changes are held in memory until committed together
+        self.batch = None
         
         # Create GUI
         self.create_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Load data (in the background; the menu is disabled until it finishes)
+        self.load_data()
     
-    def load_data(self):
+    @property
+    def students(self):
+        return self.db.students
+    
+    def run_io(self, message, task, on_done, failure, block_all=False):
+        """Run task on the I/O thread, then call on_done(result) back on the Tk thread.
+        
+        While it runs the progress bar shows message and the buttons that change data
+        (every button if block_all) are disabled.
+        """
+        self.pending_io += 1
+        self.set_busy(message, block_all)
+        future = self.io_executor.submit(task)
+        self.root.after(IO_POLL_MS, self.check_io, future, on_done, failure)
+    
+    def check_io(self, future, on_done, failure):
+        if not future.done():
+            self.root.after(IO_POLL_MS, self.check_io, future, on_done, failure)
+            return
+        
+        self.pending_io -= 1
+        if not self.pending_io:
+            self.set_idle()
         try:
-            if not os.path.exists(self.filename):
-                # Create sample data if file doesn't exist
-                self.create_sample_data()
-            
-            with open(self.filename, 'r') as file:
-                lines = file.readlines()
-                
-            # First line is number of students
-            if lines:
-                num_students = int(lines[0].strip())
-                
-            # Process student data
-            self.students = []
-            for line in lines[1:1+num_students]:
-                data = line.strip().split(',')
-                if len(data) >= 6:
-                    student = {
-                        'code': int(data[0]),
-                        'name': data[1],
-                        'coursework1': int(data[2]),
-                        'coursework2': int(data[3]),
-                        'coursework3': int(data[4]),
-                        'exam': int(data[5])
-                    }
-                    self.students.append(student)
-                    
+            result = future.result()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load data: {str(e)}")
-            self.students = []
-    
-    def create_sample_data(self):
-        """Create sample data if file doesn't exist"""
-        sample_data = [
-            "5\n",
-            "1001,John Smith,15,18,17,75\n",
-            "1002,Emily Johnson,19,20,18,88\n",
-            "1003,Michael Brown,12,14,13,62\n",
-            "1004,Sarah Davis,17,16,18,79\n",
-            "1005,David Wilson,14,15,16,70\n"
-        ]
-        
-        with open(self.filename, 'w') as file:
-            file.writelines(sample_data)
+            messagebox.showerror("Error", f"{failure}: {str(e)}")
+            return
+        on_done(result)
     
-    def save_data(self):
-        try:
-            with open(self.filename, 'w') as file:
-                file.write(f"{len(self.students)}\n")
-                for student in self.students:
-                    file.write(f"{student['code']},{student['name']},{student['coursework1']},{student['coursework2']},{student['coursework3']},{student['exam']}\n")
+    def set_busy(self, message, block_all=False):
+        for button in (self.menu_buttons if block_all else self.write_buttons):
+            button.state(['disabled'])
+        self.status_label.configure(text=message)
+        self.progress.start(10)
+    
+    def set_idle(self):
+        for button in self.menu_buttons:
+            button.state(['!disabled'])
+        if self.batch is None:
+            self.discard_button.state(['disabled'])
+        self.status_label.configure(text=self.status_text())
+        self.progress.stop()
+    
+    def status_text(self):
+        text = f"{len(self.students)} student records"
+        if self.batch is not None:
+            text += f" - batch edit: {len(self.batch)} unsaved changes"
+        return text
+    
+    def write_pending(self):
+        """Warn and return True if a save is still running, so another change must wait"""
+        if self.pending_io:
+            messagebox.showwarning("Warning", "Please wait for the current save to finish.")
             return True
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save data: {str(e)}")
-            return False
-    
-    def calculate_percentage(self, student):
-        total_coursework = student['coursework1'] + student['coursework2'] + student['coursework3']
-        total_marks = total_coursework + student['exam']  # Max 60 coursework + 100 exam = 160
-        percentage = (total_marks / 160) * 100
-        return round(percentage, 2)
-    
-    def calculate_grade(self, percentage):
-        if percentage >= 70:
-            return 'A'
-        elif percentage >= 60:
-            return 'B'
-        elif percentage >= 50:
-            return 'C'
-        elif percentage >= 40:
-            return 'D'
-        else:
-            return 'F'
+        return False
+    
+    def on_close(self):
+        if self.batch is not None and len(self.batch):
+            if not messagebox.askyesno("Confirm", f"Quit without saving {len(self.batch)} batch edit changes?"):
+                return
+        self.io_executor.shutdown(wait=True)  # Let a pending save reach the disk before exiting
+        self.root.destroy()
+    
+    def load_data(self):
+        # Load into a fresh database and swap it in on the Tk thread once it is complete
+        db = StudentDatabase(self.filename, **self.db_options)
+        
+        def load():
+            errors = db.load()
+            # Built here so the first search doesn't stall the UI: the search keys, and the
+            # code -> row dict the matching codes are looked up in
+            db.sorted_views.search_index()
+            db.code_index.positions
+            return errors
+        
+        self.run_io("Loading student records...", load, lambda errors: self.finish_load(db, errors),
+                    "Failed to load data", block_all=True)
+    
+    def finish_load(self, db, errors):
+        self.db = db
+        self.status_label.configure(text=self.status_text())
+        if errors:
+            details = "\n".join(f"Line {number}: {message}" for number, message in errors[:10])
+            if len(errors) > 10:
+                details += f"\n... and {len(errors) - 10} more"
+            messagebox.showwarning("Warning", f"Some lines in {self.filename} were skipped:\n{details}")
+    
+    def save_data(self, on_saved):
+        """Rewrite the whole marks file in the background, then call on_saved()"""
+        self.run_io("Saving student records...", self.db.save, lambda result: on_saved(), "Failed to save data")
+    
+    def save_change(self, action, student, on_saved):
+        """Persist one add ('A'), update ('U') or delete ('D') of student in the background, then call on_saved()"""
+        self.run_io("Saving student records...", lambda: self.db.save_change(action, student),
+                    lambda result: on_saved(), "Failed to save data")
+    
+    def apply_edit(self, action, student, window, message):
+        """Apply an add ('A'), update ('U') or delete ('D') from a dialog.
+        
+        Outside a batch edit the change is saved and the records re-displayed at once;
+        inside one it is only applied in memory and counted in the status bar.
+        """
+        if self.write_pending():
+            return
+        
+        if self.batch is not None:
+            self.batch.apply(action, student)
+            window.destroy()
+            self.view_all_students()  # A sorted list on screen would still hold the old codes
+            self.status_label.configure(text=self.status_text())
+            return
+        
+        student = apply_change(self.db, action, student)
+        
+        def saved():
+            messagebox.showinfo("Success", message)
+            window.destroy()
+            self.view_all_students()
+        
+        self.save_change(action, student, saved)
+    
+    def toggle_batch_edit(self):
+        if self.batch is None:
+            if self.write_pending():
+                return
+            self.batch = self.db.transaction()
+            self.batch_button.configure(text="14. Commit Batch Edit")
+            self.discard_button.state(['!disabled'])
+            self.status_label.configure(text=self.status_text())
+            messagebox.showinfo("Batch Edit", "Adds, updates and deletes are now kept in memory until you "
+                                              "commit the batch, which saves them all at once.")
+            return
+        
+        if self.write_pending():
+            return
+        
+        batch = self.batch
+        count = len(batch)
+        
+        def committed(result):
+            self.end_batch_edit()
+            messagebox.showinfo("Success", f"Saved {count} changes.")
+            self.view_all_students()
+        
+        # One durable write for the whole batch; on failure the batch stays open to retry
+        self.run_io(f"Saving {count} changes...", batch.commit, committed, "Failed to save data")
+    
+    def discard_batch_edit(self):
+        if self.batch is None or self.write_pending():
+            return
+        if len(self.batch) and not messagebox.askyesno("Confirm", f"Discard {len(self.batch)} unsaved changes?"):
+            return
+        
+        self.batch.rollback()
+        self.end_batch_edit()
+        self.view_all_students()
+    
+    def end_batch_edit(self):
+        self.batch = None
+        self.batch_button.configure(text="14. Start Batch Edit")
+        self.discard_button.state(['disabled'])
+        self.status_label.configure(text=self.status_text())
+    
+    def selected_code(self, entry):
+        # Search list entries are "code - name", so the code identifies the record
+        return int(entry.split(' - ', 1)[0])
+    
+    def create_student_search(self, window, on_choose):
+        """Search-as-you-type box and match list; returns a function giving the chosen student (or None)"""
+        search_var = tk.StringVar()
+        fuzzy_var = tk.BooleanVar()
+        
+        search_entry = ttk.Entry(window, textvariable=search_var, width=35)
+        search_entry.pack(pady=5)
+        ttk.Checkbutton(window, text="Allow one typo", variable=fuzzy_var).pack()
+        
+        results_list = tk.Listbox(window, height=8, width=40, bg='#f0f8ff', fg='#003366',
+                                  selectbackground='#cce5ff', selectforeground='#003366', exportselection=False)
+        results_list.pack(pady=5)
+        
+        def refresh(*args):
+            # Only the first SEARCH_LIMIT matches are looked up, so each keystroke stays cheap
+            matches = self.db.search(search_var.get(), SEARCH_LIMIT, fuzzy_var.get())
+            results_list.delete(0, tk.END)
+            results_list.insert(tk.END, *[f"{s['code']} - {s['name']}" for s in matches])
+            if matches:
+                results_list.selection_set(0)
+        
+        def chosen_student():
+            selection = results_list.curselection()
+            if not selection:
+                return None
+            return self.db.get_by_code(self.selected_code(results_list.get(selection[0])))
+        
+        search_var.trace_add('write', refresh)
+        fuzzy_var.trace_add('write', refresh)
+        search_entry.bind('<Return>', lambda event: on_choose())
+        results_list.bind('<Double-Button-1>', lambda event: on_choose())
+        refresh()
+        search_entry.focus_set()
+        return chosen_student
     
     def create_gui(self):
         # Configure styles for blueish theme
@@ -126,23 +275,52 @@ class StudentManager:
             ("5. Sort Student Records", self.sort_students),
             ("6. Add Student Record", self.add_student),
             ("7. Delete Student Record", self.delete_student),
-            ("8. Update Student Record", self.update_student)
+            ("8. Update Student Record", self.update_student),
+            ("9. Show Top Students", self.show_top_students),
+            ("10. Show At-Risk Students", self.show_at_risk_students),
+            ("11. Show Student Rank", self.show_student_rank),
+            ("12. Import Marks Files", self.import_marks_files),
+            ("13. Show Cohort Statistics", self.show_cohort_statistics),
+            ("14. Start Batch Edit", self.toggle_batch_edit),
+            ("15. Discard Batch Edit", self.discard_batch_edit)
         ]
         
+        self.menu_buttons = []
         for i, (text, command) in enumerate(buttons):
             btn = ttk.Button(left_frame, text=text, command=command, width=30, style='Blue.TButton')
             btn.grid(row=i, column=0, pady=5, sticky=tk.W+tk.E)
+            self.menu_buttons.append(btn)
+        
+        # Buttons that change the data, disabled while a save is still being written
+        write_commands = (self.add_student, self.delete_student, self.update_student, self.import_marks_files)
+        self.write_buttons = [btn for btn, (text, command) in zip(self.menu_buttons, buttons) if command in write_commands]
+        self.batch_button = self.menu_buttons[13]
+        self.discard_button = self.menu_buttons[14]
+        self.discard_button.state(['disabled'])
         
         # Results area with blueish background
         self.results_text = tk.Text(main_frame, width=70, height=25, wrap=tk.WORD, 
                                    bg='#f0f8ff', fg='#003366', font=('Arial', 10),
                                    selectbackground='#cce5ff', selectforeground='#003366')
         self.results_text.grid(row=1, column=1, padx=10, pady=5, sticky=(tk.W, tk.E, tk.N, tk.S))
-        
-        # Scrollbar for results
-        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.results_text.yview)
-        scrollbar.grid(row=1, column=2, sticky=(tk.N, tk.S))
-        self.results_text.configure(yscrollcommand=scrollbar.set)
+        self.results_font = tkfont.Font(family='Arial', size=10)
+        
+        # Scrollbar for results (moves the record window when a record list is shown)
+        self.results_scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.scroll_results)
+        self.results_scrollbar.grid(row=1, column=2, sticky=(tk.N, tk.S))
+        self.results_text.configure(yscrollcommand=self.on_text_scroll)
+        self.results_text.bind('<MouseWheel>', self.on_mouse_wheel)  # Windows / macOS
+        self.results_text.bind('<Button-4>', self.on_mouse_wheel)  # Linux wheel up
+        self.results_text.bind('<Button-5>', self.on_mouse_wheel)  # Linux wheel down
+        self.results_text.bind('<Configure>', lambda event: self.view_rows is not None and self.render_records())
+        
+        # Status line with a progress bar for background loads and saves
+        status_frame = ttk.Frame(main_frame, style='Blue.TFrame')
+        status_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.status_label = ttk.Label(status_frame, text="", style='Blue.TLabel')
+        self.status_label.pack(side='left')
+        self.progress = ttk.Progressbar(status_frame, mode='indeterminate', length=150)
+        self.progress.pack(side='right')
         
         # Configure grid weights
         self.root.columnconfigure(0, weight=1)
@@ -152,45 +330,87 @@ class StudentManager:
         left_frame.columnconfigure(0, weight=1)
     
     def display_results(self, text):
+        self.view_rows = None  # Plain text scrolls normally
         self.results_text.delete(1.0, tk.END)
         self.results_text.insert(1.0, text)
     
-    def format_student_output(self, student):
-        percentage = self.calculate_percentage(student)
-        grade = self.calculate_grade(percentage)
-        total_coursework = student['coursework1'] + student['coursework2'] + student['coursework3']
-        
-        output = f"Student Name: {student['name']}\n"
-        output += f"Student Number: {student['code']}\n"
-        output += f"Total Coursework: {total_coursework}/60\n"
-        output += f"Exam Mark: {student['exam']}/100\n"
-        output += f"Overall Percentage: {percentage}%\n"
-        output += f"Grade: {grade}\n"
-        output += "-" * 50 + "\n"
+    def display_records(self, header, rows, footer):
+        """Show a list of students, formatting only the ones that fit in the results area.
+        
+        rows can be any sequence of students (list, StudentColumns, StudentsByCode) and
+        footer is called only once the end of the list is scrolled into view.
+        """
+        self.view_header = header
+        self.view_rows = rows
+        self.view_footer = footer
+        self.view_first = 0
+        self.render_records()
+    
+    def visible_record_count(self):
+        lines = self.results_text.winfo_height() // self.results_font.metrics('linespace')
+        return max(lines, 25) // RECORD_LINES + 2  # Cover partly visible records at both edges
+    
+    def render_records(self):
+        rows = self.view_rows
+        first = self.view_first
+        last = min(first + self.visible_record_count(), len(rows))
         
+        output = self.view_header if first == 0 else ""
+        for index in range(first, last):
+            output += self.format_student_output(rows[index])
+        if last == len(rows):
+            output += self.view_footer()
+        
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(1.0, output)
+        total = max(len(rows), 1)
+        self.results_scrollbar.set(first / total, last / total)
+    
+    def scroll_results(self, *args):
+        if self.view_rows is None:
+            self.results_text.yview(*args)
+            return
+        
+        count = self.visible_record_count()
+        if args[0] == 'moveto':
+            first = int(float(args[1]) * len(self.view_rows))
+        else:  # ('scroll', number, 'units' or 'pages')
+            first = self.view_first + int(args[1]) * (count - 2 if args[2] == 'pages' else 1)
+        
+        self.view_first = max(0, min(first, len(self.view_rows) - count + 2))
+        self.render_records()
+    
+    def on_text_scroll(self, first, last):
+        if self.view_rows is None:
+            self.results_scrollbar.set(first, last)
+    
+    def on_mouse_wheel(self, event):
+        if self.view_rows is None:
+            return None  # Let the Text widget scroll its own contents
+        
+        step = -1 if event.num == 4 or getattr(event, 'delta', 0) > 0 else 1
+        self.scroll_results('scroll', step, 'units')
+        return "break"
+    
+    def summary_text(self, students):
+        metrics = self.db.metrics
+        output = self.db.summary(students)
+        output += f"Metrics cache: {metrics.hits} hits, {metrics.misses} misses ({metrics.hit_rate():.0%} hit rate)\n"
         return output
     
+    def format_student_output(self, student):
+        return self.db.format_student(student)
+    
     def view_all_students(self):
         if not self.students:
             self.display_results("No student records found.")
             return
         
-        output = "ALL STUDENT RECORDS\n"
-        output += "=" * 50 + "\n\n"
-        
-        total_percentage = 0
-        
-        for student in self.students:
-            output += self.format_student_output(student)
-            total_percentage += self.calculate_percentage(student)
+        header = "ALL STUDENT RECORDS\n"
+        header += "=" * 50 + "\n\n"
         
-        # Summary
-        avg_percentage = total_percentage / len(self.students)
-        output += f"\nSUMMARY:\n"
-        output += f"Number of students: {len(self.students)}\n"
-        output += f"Average percentage: {avg_percentage:.2f}%\n"
-        
-        self.display_results(output)
+        students = self.students
+        self.display_records(header, students, lambda: self.summary_text(students))
     
     def view_individual_student(self):
         if not self.students:
@@ -200,27 +420,21 @@ class StudentManager:
         # Create selection dialog with blueish theme
         selection_window = tk.Toplevel(self.root)
         selection_window.title("Select Student")
-        selection_window.geometry("300x200")
+        selection_window.geometry("320x330")
         selection_window.configure(bg='#e6f2ff')
         
-        ttk.Label(selection_window, text="Select Student:", style='Blue.TLabel').pack(pady=10)
-        
-        # Create combobox with student names and codes
-        student_list = [f"{s['code']} - {s['name']}" for s in self.students]
-        combo_var = tk.StringVar()
-        student_combo = ttk.Combobox(selection_window, textvariable=combo_var, values=student_list, state="readonly")
-        student_combo.pack(pady=10)
+        ttk.Label(selection_window, text="Search by name, surname or code:", style='Blue.TLabel').pack(pady=10)
         
         def show_selected():
-            selected_index = student_combo.current()
-            if selected_index >= 0:
-                student = self.students[selected_index]
+            student = chosen_student()
+            if student is not None:
                 output = "INDIVIDUAL STUDENT RECORD\n"
                 output += "=" * 50 + "\n\n"
                 output += self.format_student_output(student)
                 self.display_results(output)
                 selection_window.destroy()
         
+        chosen_student = self.create_student_search(selection_window, show_selected)
         ttk.Button(selection_window, text="Show Record", command=show_selected, style='Blue.TButton').pack(pady=10)
     
     def show_highest_student(self):
@@ -228,7 +442,7 @@ class StudentManager:
             messagebox.showwarning("Warning", "No student records available.")
             return
         
-        highest_student = max(self.students, key=lambda x: self.calculate_percentage(x))
+        highest_student = self.db.highest_student()
         
         output = "STUDENT WITH HIGHEST MARK\n"
         output += "=" * 50 + "\n\n"
@@ -241,7 +455,7 @@ class StudentManager:
             messagebox.showwarning("Warning", "No student records available.")
             return
         
-        lowest_student = min(self.students, key=lambda x: self.calculate_percentage(x))
+        lowest_student = self.db.lowest_student()
         
         output = "STUDENT WITH LOWEST MARK\n"
         output += "=" * 50 + "\n\n"
@@ -249,6 +463,54 @@ class StudentManager:
         
         self.display_results(output)
     
+    def show_top_students(self):
+        if not self.students:
+            messagebox.showwarning("Warning", "No student records available.")
+            return
+        
+        k = simpledialog.askinteger("Top Students", "How many top students?", parent=self.root,
+                                    initialvalue=min(50, len(self.students)), minvalue=1)
+        if k:
+            self.display_sorted_results(self.db.top_students(k), f"TOP {k} BY PERCENTAGE")
+    
+    def show_at_risk_students(self):
+        if not self.students:
+            messagebox.showwarning("Warning", "No student records available.")
+            return
+        
+        percent = simpledialog.askfloat("At-Risk Students", "Show the bottom percent of the cohort:", parent=self.root,
+                                        initialvalue=10, minvalue=0.1, maxvalue=100)
+        if percent:
+            self.display_sorted_results(self.db.bottom_percent(percent), f"BOTTOM {percent:g}% BY PERCENTAGE")
+    
+    def show_student_rank(self):
+        if not self.students:
+            messagebox.showwarning("Warning", "No student records available.")
+            return
+        
+        code = simpledialog.askinteger("Student Rank", "Student code:", parent=self.root)
+        if code is None:
+            return
+        
+        rank = self.db.rank_of(code)
+        if rank is None:
+            messagebox.showerror("Error", f"No student with code {code}")
+            return
+        
+        output = "STUDENT RANK\n"
+        output += "=" * 50 + "\n\n"
+        output += f"Rank: {rank} of {len(self.students)} by percentage\n\n"
+        output += self.format_student_output(self.db.get_by_code(code))
+        
+        self.display_results(output)
+    
+    def show_cohort_statistics(self):
+        if not self.students:
+            messagebox.showwarning("Warning", "No student records available.")
+            return
+        
+        self.display_results(format_statistics(self.db.statistics()))
+    
     def sort_students(self):
         if not self.students:
             messagebox.showwarning("Warning", "No student records available.")
@@ -267,22 +529,22 @@ class StudentManager:
         button_frame.pack(pady=10, fill='both', expand=True)
         
         def sort_by_percentage():
-            sorted_students = sorted(self.students, key=lambda x: self.calculate_percentage(x), reverse=True)
+            sorted_students = self.db.sorted_view('percentage', reverse=True)
             self.display_sorted_results(sorted_students, "PERCENTAGE (DESCENDING)")
             sort_window.destroy()
         
         def sort_by_name():
-            sorted_students = sorted(self.students, key=lambda x: x['name'])
+            sorted_students = self.db.sorted_view('name')
             self.display_sorted_results(sorted_students, "NAME (ASCENDING)")
             sort_window.destroy()
         
         def sort_by_code():
-            sorted_students = sorted(self.students, key=lambda x: x['code'])
+            sorted_students = self.db.sorted_view('code')
             self.display_sorted_results(sorted_students, "STUDENT CODE (ASCENDING)")
             sort_window.destroy()
         
         def sort_by_total_marks():
-            sorted_students = sorted(self.students, key=lambda x: (x['coursework1'] + x['coursework2'] + x['coursework3'] + x['exam']), reverse=True)
+            sorted_students = self.db.sorted_view('total', reverse=True)
             self.display_sorted_results(sorted_students, "TOTAL MARKS (DESCENDING)")
             sort_window.destroy()
         
@@ -305,21 +567,10 @@ class StudentManager:
     
     def display_sorted_results(self, sorted_students, sort_type):
         """Helper method to display sorted results"""
-        output = f"SORTED STUDENT RECORDS ({sort_type})\n"
-        output += "=" * 50 + "\n\n"
-        
-        total_percentage = 0
-        for student in sorted_students:
-            output += self.format_student_output(student)
-            total_percentage += self.calculate_percentage(student)
+        header = f"SORTED STUDENT RECORDS ({sort_type})\n"
+        header += "=" * 50 + "\n\n"
         
-        # Summary
-        avg_percentage = total_percentage / len(sorted_students)
-        output += f"\nSUMMARY:\n"
-        output += f"Number of students: {len(sorted_students)}\n"
-        output += f"Average percentage: {avg_percentage:.2f}%\n"
-        
-        self.display_results(output)
+        self.display_records(header, sorted_students, lambda: self.summary_text(sorted_students))
     
     def add_student(self):
         add_window = tk.Toplevel(self.root)
@@ -355,53 +606,31 @@ class StudentManager:
         def save_student():
             try:
                 # Validate inputs
-                code = int(code_entry.get())
-                name = name_entry.get().strip()
-                cw1 = int(cw1_entry.get())
-                cw2 = int(cw2_entry.get())
-                cw3 = int(cw3_entry.get())
-                exam = int(exam_entry.get())
-                
-                if not (1000 <= code <= 9999):
-                    messagebox.showerror("Error", "Student code must be between 1000 and 9999")
-                    return
-                
-                if not name:
-                    messagebox.showerror("Error", "Student name is required")
-                    return
-                
-                if not (0 <= cw1 <= 20) or not (0 <= cw2 <= 20) or not (0 <= cw3 <= 20):
-                    messagebox.showerror("Error", "Coursework marks must be between 0 and 20")
-                    return
-                
-                if not (0 <= exam <= 100):
-                    messagebox.showerror("Error", "Exam mark must be between 0 and 100")
-                    return
-                
-                # Check if code already exists
-                if any(s['code'] == code for s in self.students):
-                    messagebox.showerror("Error", "Student code already exists")
-                    return
-                
-                # Add new student
                 new_student = {
-                    'code': code,
-                    'name': name,
-                    'coursework1': cw1,
-                    'coursework2': cw2,
-                    'coursework3': cw3,
-                    'exam': exam
+                    'code': int(code_entry.get()),
+                    'name': name_entry.get().strip(),
+                    'coursework1': int(cw1_entry.get()),
+                    'coursework2': int(cw2_entry.get()),
+                    'coursework3': int(cw3_entry.get()),
+                    'exam': int(exam_entry.get())
                 }
-                
-                self.students.append(new_student)
-                
-                if self.save_data():
-                    messagebox.showinfo("Success", "Student added successfully!")
-                    add_window.destroy()
-                    self.view_all_students()
-                
             except ValueError:
                 messagebox.showerror("Error", "Please enter valid numbers for all marks")
+                return
+            
+            try:
+                validate_student(new_student)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            
+            # Check if code already exists
+            if new_student['code'] in self.db.code_index:
+                messagebox.showerror("Error", "Student code already exists")
+                return
+            
+            # Add new student
+            self.apply_edit('A', new_student, add_window, "Student added successfully!")
         
         ttk.Button(add_window, text="Save", command=save_student, style='Blue.TButton').pack(pady=10)
     
@@ -413,27 +642,18 @@ class StudentManager:
         # Create selection dialog with blueish theme
         delete_window = tk.Toplevel(self.root)
         delete_window.title("Delete Student")
-        delete_window.geometry("300x200")
+        delete_window.geometry("320x330")
         delete_window.configure(bg='#e6f2ff')
         
-        ttk.Label(delete_window, text="Select Student to Delete:", style='Blue.TLabel').pack(pady=10)
-        
-        student_list = [f"{s['code']} - {s['name']}" for s in self.students]
-        combo_var = tk.StringVar()
-        student_combo = ttk.Combobox(delete_window, textvariable=combo_var, values=student_list, state="readonly")
-        student_combo.pack(pady=10)
+        ttk.Label(delete_window, text="Search for the Student to Delete:", style='Blue.TLabel').pack(pady=10)
         
         def delete_selected():
-            selected_index = student_combo.current()
-            if selected_index >= 0:
-                student = self.students[selected_index]
+            student = chosen_student()
+            if student is not None and not self.write_pending():
                 if messagebox.askyesno("Confirm", f"Delete {student['name']} ({student['code']})?"):
-                    del self.students[selected_index]
-                    if self.save_data():
-                        messagebox.showinfo("Success", "Student deleted successfully!")
-                        delete_window.destroy()
-                        self.view_all_students()
+                    self.apply_edit('D', student, delete_window, "Student deleted successfully!")
         
+        chosen_student = self.create_student_search(delete_window, delete_selected)
         ttk.Button(delete_window, text="Delete", command=delete_selected, style='Blue.TButton').pack(pady=10)
     
     def update_student(self):
@@ -444,26 +664,21 @@ class StudentManager:
         # Create selection dialog with blueish theme
         update_window = tk.Toplevel(self.root)
         update_window.title("Update Student")
-        update_window.geometry("300x200")
+        update_window.geometry("320x330")
         update_window.configure(bg='#e6f2ff')
         
-        ttk.Label(update_window, text="Select Student to Update:", style='Blue.TLabel').pack(pady=10)
-        
-        student_list = [f"{s['code']} - {s['name']}" for s in self.students]
-        combo_var = tk.StringVar()
-        student_combo = ttk.Combobox(update_window, textvariable=combo_var, values=student_list, state="readonly")
-        student_combo.pack(pady=10)
+        ttk.Label(update_window, text="Search for the Student to Update:", style='Blue.TLabel').pack(pady=10)
         
         def update_selected():
-            selected_index = student_combo.current()
-            if selected_index >= 0:
-                student = self.students[selected_index]
+            student = chosen_student()
+            if student is not None:
                 update_window.destroy()
-                self.show_update_form(student, selected_index)
+                self.show_update_form(student)
         
+        chosen_student = self.create_student_search(update_window, update_selected)
         ttk.Button(update_window, text="Update", command=update_selected, style='Blue.TButton').pack(pady=10)
     
-    def show_update_form(self, student, index):
+    def show_update_form(self, student):
         update_form = tk.Toplevel(self.root)
         update_form.title(f"Update {student['name']}")
         update_form.geometry("300x350")
@@ -497,44 +712,99 @@ class StudentManager:
         
         def save_update():
             try:
-                name = name_entry.get().strip()
-                cw1 = int(cw1_entry.get())
-                cw2 = int(cw2_entry.get())
-                cw3 = int(cw3_entry.get())
-                exam = int(exam_entry.get())
-                
-                if not name:
-                    messagebox.showerror("Error", "Student name is required")
-                    return
-                
-                if not (0 <= cw1 <= 20) or not (0 <= cw2 <= 20) or not (0 <= cw3 <= 20):
-                    messagebox.showerror("Error", "Coursework marks must be between 0 and 20")
-                    return
-                
-                if not (0 <= exam <= 100):
-                    messagebox.showerror("Error", "Exam mark must be between 0 and 100")
-                    return
-                
-                # Update student
-                self.students[index]['name'] = name
-                self.students[index]['coursework1'] = cw1
-                self.students[index]['coursework2'] = cw2
-                self.students[index]['coursework3'] = cw3
-                self.students[index]['exam'] = exam
-                
-                if self.save_data():
-                    messagebox.showinfo("Success", "Student updated successfully!")
-                    update_form.destroy()
-                    self.view_all_students()
-                
+                # Whole record is replaced so compact columns stay in sync
+                updated_student = {
+                    'code': student['code'],
+                    'name': name_entry.get().strip(),
+                    'coursework1': int(cw1_entry.get()),
+                    'coursework2': int(cw2_entry.get()),
+                    'coursework3': int(cw3_entry.get()),
+                    'exam': int(exam_entry.get())
+                }
             except ValueError:
                 messagebox.showerror("Error", "Please enter valid numbers for all marks")
+                return
+            
+            try:
+                validate_student(updated_student, check_code=False)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            
+            # Update student
+            self.apply_edit('U', updated_student, update_form, "Student updated successfully!")
         
         ttk.Button(update_form, text="Save Changes", command=save_update, style='Blue.TButton').pack(pady=10)
+    
+    def import_marks_files(self):
+        import_window = tk.Toplevel(self.root)
+        import_window.title("Import Marks Files")
+        import_window.geometry("320x230")
+        import_window.configure(bg='#e6f2ff')
+        
+        ttk.Label(import_window, text="If a student code appears more than once:", style='Blue.TLabel').pack(pady=10)
+        
+        policy_var = tk.StringVar(value='newest')
+        policies = [
+            ("Keep the record from the newest file", 'newest'),
+            ("Keep the record with the highest marks", 'highest'),
+            ("Keep the first record and report clashes", 'report')
+        ]
+        for text, value in policies:
+            ttk.Radiobutton(import_window, text=text, variable=policy_var, value=value).pack(anchor=tk.W, padx=20)
+        
+        def choose_files():
+            filenames = filedialog.askopenfilenames(parent=import_window, title="Select marks files",
+                                                    filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+            if not filenames or self.write_pending():
+                return
+            if self.batch is not None:
+                messagebox.showwarning("Warning", "Commit or discard the batch edit before importing.")
+                return
+            
+            policy = policy_var.get()
+            import_window.destroy()
+            
+            # Files are parsed in worker processes; the current cohort is merged in as the base
+            def task():
+                students, conflicts, errors = self.db.merge_files(list(filenames), policy)
+                if self.db.compact:
+                    students = StudentColumns.from_records(students)
+                # The indexes are built here too, so replace_all on the Tk thread stays cheap
+                code_index = CodeIndex(students)
+                code_index.positions
+                return students, SearchIndex.for_students(students), code_index, conflicts, errors
+            
+            self.run_io(f"Importing {len(filenames)} files...", task, self.finish_import,
+                        "Failed to import files", block_all=True)
+        
+        ttk.Button(import_window, text="Choose Files and Import", command=choose_files, style='Blue.TButton').pack(pady=15)
+    
+    def finish_import(self, result):
+        students, search_index, code_index, conflicts, errors = result
+        self.db.replace_all(students, search_index, code_index)
+        
+        details = f"Cohort now has {len(students)} students."
+        if errors:
+            details += f"\n{len(errors)} lines were skipped, e.g.:\n"
+            details += "\n".join(f"{filename} line {number}: {message}" for filename, number, message in errors[:5])
+        if conflicts:
+            details += f"\n{len(conflicts)} conflicting records were not imported, e.g.:\n"
+            details += "\n".join(f"Code {code}: {dropped} differs from {kept}" for code, kept, dropped in conflicts[:5])
+        
+        def saved():
+            messagebox.showinfo("Import Complete", details)
+            self.view_all_students()
+        
+        self.save_data(saved)
 
 def main():
     root = tk.Tk()  # Create root window
-    app = StudentManager(root) # Instantiate the app
+    compact = '--compact' in sys.argv[1:]  # Typed-column storage for very large cohorts
+    journal = '--journal' in sys.argv[1:]  # Append changes to a journal instead of rewriting the file
+    snapshot = '--snapshot' in sys.argv[1:]  # Start from a memory-mapped binary snapshot of the marks file
+    sqlite = '--sqlite' in sys.argv[1:]  # Keep the records in an SQLite database next to the marks file
+    app = StudentManager(root, compact=compact, journal=journal, snapshot=snapshot, sqlite=sqlite) # Instantiate the app
     root.mainloop() # Start the Tkinter event loop
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+"""Benchmarks for the Student Manager (Exercise 3) data layer, run without Tkinter.
+
+Generates reproducible synthetic cohorts in the studentMarks.txt format, times
+the operations behind the GUI (load, save, percentages, each sort, highest) on
+every storage engine and prints the results as JSON, e.g.
+
+    python benchmark_students.py
+    python benchmark_students.py --sizes 1000 100000 --engines text sqlite --output bench.json
+
+Each operation runs once untimed (so snapshot and SQLite files exist and caches
+are warm), then --repeat timed runs of which the fastest is reported, then one
+more run under tracemalloc for the peak memory. tracemalloc only sees Python
+allocations, so memory-mapped snapshots and SQLite's own cache are not counted.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from student_core import SortedViews, StudentDatabase, format_student_line
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# StudentDatabase options for each storage engine
+ENGINES = {
+    'text': {},
+    'compact': {'compact': True},
+    'snapshot': {'snapshot': True},
+    'journal': {'journal': True},
+    'sqlite': {'sqlite': True}
+}
+
+FIRST_NAMES = ['John', 'Emily', 'Michael', 'Sarah', 'David', 'Alan', 'Gareth', 'Jo', 'Sam', 'Lee',
+               'Matt', 'Jake', 'Les', 'Olivia', 'Amelia', 'Noah', 'Isla', 'Oscar', 'Ava', 'Leo']
+SURNAMES = ['Smith', 'Johnson', 'Brown', 'Davis', 'Wilson', 'Shearer', 'Southgate', 'Hyde', 'Scott',
+            'Thompson', 'Hobbs', 'Ferdinand', 'Curry', 'Taylor', 'Evans', 'Walker', 'Wright', 'Green']
+
+
+def write_cohort(filename, count, seed):
+    """Write count random students to filename in the marks file format, streaming the lines"""
+    rng = random.Random(seed)
+    codes = list(range(10000, 10000 + count))  # Unique codes for any cohort size
+    rng.shuffle(codes)
+
+    with open(filename, 'w') as file:
+        file.write(f"{count}\n")
+        for code in codes:
+            student = {
+                'code': code,
+                'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}",
+                'coursework1': rng.randint(0, 20),
+                'coursework2': rng.randint(0, 20),
+                'coursework3': rng.randint(0, 20),
+                'exam': rng.randint(0, 100)
+            }
+            file.write(format_student_line(student))
+
+
+def operations(filename, options):
+    """(name, setup, run) for every benchmarked operation; setup returns what run is given.
+
+    The cohort is loaded once and shared; setups only reset the caches and sorted
+    indexes the operation would otherwise reuse.
+    """
+    db = StudentDatabase(filename, **options)
+    db.load()
+
+    def loaded():
+        return db
+
+    def cold_metrics():
+        db.metrics.clear()
+        return db
+
+    def unsorted():
+        db.sorted_views = SortedViews(db.students)  # Sorted indexes are rebuilt, not reused
+        return db
+
+    def sort(key, reverse):
+        return lambda db: db.sorted_view(key, reverse)
+
+    return [
+        ('load', lambda: StudentDatabase(filename, **options), lambda db: db.load()),
+        ('save', loaded, lambda db: db.save()),
+        ('percentage', cold_metrics, lambda db: [db.calculate_percentage(s) for s in db.students]),
+        ('sort_percentage', unsorted, sort('percentage', True)),
+        ('sort_name', unsorted, sort('name', False)),
+        ('sort_code', unsorted, sort('code', False)),
+        ('sort_total', unsorted, sort('total', True)),
+        ('highest', loaded, lambda db: db.highest_student())
+    ]
+
+
+def time_operation(setup, run, repeat):
+    """Fastest of repeat timed runs (after one untimed warm-up run), in seconds"""
+    run(setup())
+    best = None
+    for _ in range(repeat):
+        subject = setup()
+        start = time.perf_counter()
+        run(subject)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(setup, run):
+    """Peak Python memory allocated while run executes, in bytes"""
+    subject = setup()
+    tracemalloc.start()
+    try:
+        run(subject)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(sizes, engines, repeat=3, seed=1, workdir=None, memory=True, progress=None):
+    """Run every operation for each size and engine; return the list of result dicts"""
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as directory:
+        for size in sizes:
+            source = os.path.join(directory, f"cohort_{size}.txt")
+            write_cohort(source, size, seed)
+
+            for engine in engines:
+                # Each engine gets its own copy, as snapshot/journal/SQLite files live beside it
+                filename = os.path.join(directory, f"{engine}_{size}.txt")
+                with open(source, 'rb') as src, open(filename, 'wb') as dst:
+                    dst.write(src.read())
+
+                for name, setup, run in operations(filename, ENGINES[engine]):
+                    seconds = time_operation(setup, run, repeat)
+                    result = {
+                        'engine': engine,
+                        'rows': size,
+                        'operation': name,
+                        'seconds': round(seconds, 6),
+                        'rows_per_second': round(size / seconds) if seconds else None,
+                        'peak_bytes': peak_memory(setup, run) if memory else None
+                    }
+                    results.append(result)
+                    if progress:
+                        progress(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Student Manager data layer")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="cohort sizes (default: 1000 10000 100000 1000000)")
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per operation; the fastest is reported")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for the synthetic cohorts")
+    parser.add_argument('--workdir', help="directory for the generated files (default: system temp)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak memory run")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--quiet', action='store_true', help="no progress lines on stderr")
+    args = parser.parse_args(argv)
+
+    def progress(result):
+        print(f"{result['engine']:>8} {result['rows']:>8} {result['operation']:<16} {result['seconds']:.4f}s",
+              file=sys.stderr)
+
+    results = benchmark(args.sizes, args.engines, args.repeat, args.seed, args.workdir,
+                        memory=not args.no_memory, progress=None if args.quiet else progress)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': results
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""Offline compiler for the Joke Teller (Exercise 2) joke file.
+
+Reads randomJokes.txt (or any file in its format) one line at a time, tidies
+each joke, drops malformed lines and duplicates, and writes the rest to a
+compiled corpus (randomJokes.txt.jokes) that the assistant opens instead of the
+text while it is up to date, e.g.
+
+    python compile_jokes.py
+    python compile_jokes.py big_jokes.txt --keep-malformed --rejects rejects.tsv
+
+A line is malformed if it has no '?' or nothing after it. Exact duplicates are
+lines with the same words once case and punctuation are ignored (found by a
+64-bit hash); near duplicates are found with MinHash over word pairs, bucketed
+by LSH bands, and dropped only if their actual Jaccard similarity with an
+earlier joke reaches --threshold. Memory grows with the number of distinct
+jokes, never with the size of the input: one hash, six bucket entries, an
+offset and a split each, in typed arrays, about 100-150 bytes a joke and up to
+200 while a table doubles, so 10 million distinct jokes need up to 2 GB and
+100 million up to 20 GB; with --no-near it is about 50 bytes a joke.
+Normalizing and hashing, most of the work, is spread over --workers processes;
+deduplication stays in input order, so the output is the same for any number
+of workers.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import unicodedata
+import zlib
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from joke_core import CompiledJokeWriter, compiled_jokes_path, joke_words
+
+SHINGLE_WORDS = 2  # Jokes are short, so pairs of words; one changed word still leaves most pairs alike
+MINHASH_BANDS = 6
+MINHASH_ROWS = 3  # 6 bands of 3 of the 18 min-hashes: similarity ~0.55 and up becomes a candidate
+DEFAULT_THRESHOLD = 0.7
+PROGRESS_LINES = 1000000
+CHUNK_LINES = 20000  # Lines per task handed to a worker process
+
+
+def normalize_line(text):
+    """Collapse runs of whitespace and use one Unicode form, so equal jokes are equal strings"""
+    text = " ".join(text.split())
+    return text if text.isascii() else unicodedata.normalize('NFC', text)
+
+
+def content_hash(words):
+    digest = hashlib.blake2b(" ".join(words).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1  # 0 marks an empty HashTable slot
+
+
+def shingles(words, size=SHINGLE_WORDS):
+    """CRC-32s of every run of size words (the whole joke if it is shorter).
+
+    Unlike hash() these are the same in every process, so workers agree on them.
+    """
+    encoded = [word.encode('utf-8') for word in words]
+    if len(encoded) <= size:
+        return {zlib.crc32(b' '.join(encoded))} if encoded else set()
+    return {zlib.crc32(b' '.join(run)) for run in zip(*(encoded[i:] for i in range(size)))}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class MinHasher:
+    """MinHash signatures split into LSH bands, by one-permutation hashing.
+
+    Rather than bands * rows separate hash functions, each shingle hash goes to
+    one of bands * rows bins (by its low bits) and each bin keeps its smallest
+    value, which is one pass over the shingles. Bins no shingle landed in borrow
+    the value of the next filled bin (rotation densification), marked with the
+    distance so they stay comparable between jokes.
+    """
+
+    def __init__(self, bands=MINHASH_BANDS, rows=MINHASH_ROWS):
+        self.bands = bands
+        self.rows = rows
+        self.bins = bands * rows
+
+    def signature(self, shingle_hashes):
+        bins = self.bins
+        signature = [None] * bins
+        for h in shingle_hashes:
+            b = h % bins
+            v = h // bins
+            current = signature[b]
+            if current is None or v < current:
+                signature[b] = v
+        if None in signature:
+            for b in range(bins):
+                if signature[b] is None:
+                    distance = 1
+                    while signature[(b + distance) % bins] is None:
+                        distance += 1
+                    signature[b] = (distance, signature[(b + distance) % bins])
+        return signature
+
+    def band_keys(self, shingle_hashes):
+        """One non-zero 32-bit bucket key per band; jokes sharing any key are near-duplicate candidates.
+
+        32 bits keep the bucket table small; the odd key two bands share by chance
+        only adds a candidate, which the Jaccard check then turns down.
+        """
+        signature = self.signature(shingle_hashes)
+        rows = self.rows
+        return [hash((band, *signature[band * rows:(band + 1) * rows])) & 0xFFFFFFFF or 1
+                for band in range(self.bands)]
+
+
+HASHER = MinHasher()
+
+
+class HashTable:
+    """Open-addressing hash table of non-zero integer keys, kept in typed arrays.
+
+    A set or dict of ints spends 60-70 bytes an entry on int objects and slots;
+    here a slot is just the key (and value, if value_type is given) in place.
+    Keys are already hashes, so their low bits pick the slot, and the table
+    doubles once it is two thirds full.
+    """
+
+    def __init__(self, key_type, value_type=None, capacity=1 << 16):
+        self.key_type = key_type
+        self.value_type = value_type
+        self.size = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        self.mask = capacity - 1
+        self.keys = array(self.key_type, bytes(capacity * array(self.key_type).itemsize))
+        if self.value_type:
+            self.values = array(self.value_type, bytes(capacity * array(self.value_type).itemsize))
+        else:
+            self.values = None
+
+    def __len__(self):
+        return self.size
+
+    def slots(self, keys):
+        """The slot of each key: where it is stored, or the empty slot it would go in"""
+        table = self.keys
+        mask = self.mask
+        found = []
+        for key in keys:
+            i = key & mask
+            while table[i] and table[i] != key:
+                i = (i + 1) & mask
+            found.append(i)
+        return found
+
+    def fill(self, slots, keys, value=0):
+        """Store each of keys not already present, at the slot slots() gave it, with value"""
+        table = self.keys
+        mask = self.mask
+        for i, key in zip(slots, keys):
+            while table[i] and table[i] != key:  # Taken by an earlier key of this same call
+                i = (i + 1) & mask
+            if not table[i]:
+                table[i] = key
+                if self.values is not None:
+                    self.values[i] = value
+                self.size += 1
+        if 3 * self.size > 2 * len(table):
+            self.grow()
+
+    def add(self, key):
+        """Store key; False if it was already there"""
+        i, = slot = self.slots((key,))
+        if self.keys[i]:
+            return False
+        self.fill(slot, (key,))
+        return True
+
+    def grow(self):
+        keys, values = self.keys, self.values
+        self.allocate(2 * len(keys))
+        table = self.keys
+        mask = self.mask
+        for j, key in enumerate(keys):
+            if key:
+                i = key & mask
+                while table[i]:
+                    i = (i + 1) & mask
+                table[i] = key
+                if values is not None:
+                    self.values[i] = values[j]
+
+
+def analyse_line(raw, keep_malformed=False, near=True):
+    """Everything about one raw line that does not depend on the lines before it.
+
+    Returns (reason, text, setup, punchline, content hash, band keys). reason is
+    None for a good joke, 'blank', or why the line is malformed; setup and
+    punchline are UTF-8 (punchline None if the joke is kept without one).
+    """
+    try:
+        text = normalize_line(raw.decode('utf-8'))
+    except UnicodeDecodeError:
+        return 'invalid-utf8', raw.decode('utf-8', 'replace').strip(), None, None, None, None
+    if not text:
+        return 'blank', text, None, None, None, None
+
+    # Split on the first '?' as Joke.parse does; the punchline is kept without leading space
+    setup, question, punchline = text.partition('?')
+    punchline = punchline.strip()
+    reason = None
+    if not question or not punchline:
+        reason = 'no-question-mark' if not question else 'empty-punchline'
+        if not keep_malformed:
+            return reason, text, None, None, None, None
+        setup, punchline = text, None  # Kept whole; told with NO_PUNCHLINE
+    else:
+        setup += question
+
+    words = joke_words(text)
+    joke_shingles = shingles(words) if near else None
+    keys = HASHER.band_keys(joke_shingles) if joke_shingles else []
+    return (reason, text, setup.encode('utf-8'), None if punchline is None else punchline.encode('utf-8'),
+            content_hash(words), keys)
+
+
+def analyse_lines(lines, keep_malformed, near):
+    return [analyse_line(raw, keep_malformed, near) for raw in lines]
+
+
+def analysed(file, keep_malformed, near, workers):
+    """analyse_line for every line of file, in order, spread over worker processes if workers > 1.
+
+    Only a few chunks per worker are in flight at once, so memory stays flat however long the file is.
+    """
+    if workers <= 1:
+        for raw in file:
+            yield analyse_line(raw, keep_malformed, near)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(file, CHUNK_LINES))
+                if not chunk:
+                    break
+                pending.append(pool.submit(analyse_lines, chunk, keep_malformed, near))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+
+def compile_jokes(source, output=None, keep_malformed=False, near=True, threshold=DEFAULT_THRESHOLD,
+                  rejects=None, progress=None, workers=1):
+    """Compile source into output (default: the path the assistant looks for); return the counts"""
+    output = output or compiled_jokes_path(source)
+    source_stat = os.stat(source)  # Stamped into the output, which goes stale if the source changes
+    counts = Counter()
+    seen = HashTable('Q')  # Content hashes of every joke kept
+    buckets = HashTable('I', 'I')  # LSH band key -> id of the first joke kept with it
+    writer = CompiledJokeWriter(output)
+    reject_file = open(rejects, 'w', encoding='utf-8') if rejects else None
+
+    def reject(line_number, reason, text):
+        counts[reason] += 1
+        if reject_file:
+            reject_file.write(f"{line_number}\t{reason}\t{text}\n")
+
+    line_number = 0
+    try:
+        with open(source, 'rb') as file:
+            for line_number, line in enumerate(analysed(file, keep_malformed, near, workers), 1):
+                if progress and line_number % PROGRESS_LINES == 0:
+                    progress(line_number, len(writer))
+                reason, text, setup, punchline, key, keys = line
+                if reason == 'blank':
+                    counts['blank'] += 1
+                    continue
+                if reason:
+                    reject(line_number, reason, text)  # Flagged even when --keep-malformed keeps it
+                if setup is None:
+                    continue
+
+                if not seen.add(key):
+                    reject(line_number, 'duplicate', text)
+                    continue
+
+                if keys:
+                    slots = buckets.slots(keys)
+                    candidates = {buckets.values[i] for i in slots if buckets.keys[i]}
+                    if candidates:
+                        # LSH only proposes candidates; confirm against the earlier joke's actual words
+                        joke_shingles = shingles(joke_words(text))
+                        if any(jaccard(joke_shingles, shingles(joke_words(writer.text(other).decode('utf-8'))))
+                               >= threshold for other in candidates):
+                            reject(line_number, 'near-duplicate', text)
+                            continue
+                    buckets.fill(slots, keys, len(writer))  # Bands no earlier joke had now point here
+
+                writer.add(setup, punchline)
+        counts['lines'] = line_number
+        counts['jokes'] = len(writer)
+        writer.close(source_stat)
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if reject_file:
+            reject_file.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean, deduplicate and compile a joke file for the Joke Teller")
+    parser.add_argument('source', nargs='?', default='randomJokes.txt', help="joke file (default: randomJokes.txt)")
+    parser.add_argument('--output', help="compiled corpus path (default: SOURCE.jokes, which the assistant loads)")
+    parser.add_argument('--keep-malformed', action='store_true',
+                        help="keep lines with no '?' or no punchline (told without one) instead of dropping them")
+    parser.add_argument('--no-near', action='store_true',
+                        help="only drop exact duplicates (faster, about 50 bytes a joke instead of 150-200)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Jaccard similarity of word pairs at which a joke is a near duplicate (default: 0.7)")
+    parser.add_argument('--rejects', help="write every dropped or flagged line here as line<TAB>reason<TAB>text")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes that normalize and hash lines (default: one per CPU)")
+    parser.add_argument('--quiet', action='store_true', help="no progress lines on stderr")
+    args = parser.parse_args(argv)
+
+    def progress(lines, jokes):
+        print(f"{lines:>12} lines read, {jokes} jokes kept", file=sys.stderr)
+
+    start = time.perf_counter()
+    try:
+        counts = compile_jokes(args.source, args.output, args.keep_malformed, not args.no_near, args.threshold,
+                               args.rejects, None if args.quiet else progress, args.workers)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    report = dict(counts)
+    report['output'] = args.output or compiled_jokes_path(args.source)
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
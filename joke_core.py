@@ -0,0 +1,933 @@
+"""Joke Teller (Exercise 2) joke corpus, without Tkinter.
+
+Each line of randomJokes.txt is a joke whose setup ends at the first '?'. The
+corpus is split once when it is loaded and kept as one UTF-8 buffer with an
+offset per joke, so telling a joke is a lookup by id. For very large files MappedJokeCorpus memory-maps the file
+instead and only decodes the jokes that are asked for. CompiledJokeCorpus opens
+the cleaned, pre-split artifact written by compile_jokes.py. JokeIndex finds the
+jokes using a word. JokeFileWatcher spots edits to the file so a running
+assistant can pick them up.
+"""
+import mmap
+import os
+import random
+import re
+import struct
+import zlib
+from array import array
+from collections import deque
+
+NO_PUNCHLINE = "(Punchline not available)"
+NO_SPLIT = 0xFFFFFFFF  # Setup length stored for a line without a '?'
+WORD = re.compile(r'\w+')
+
+
+class Joke:
+    """One joke split into its setup (up to and including the first '?') and punchline"""
+
+    __slots__ = ('setup', 'punchline')  # Made per joke told, so kept to the two strings
+
+    def __init__(self, setup, punchline):
+        self.setup = setup
+        self.punchline = punchline
+
+    @classmethod
+    def parse(cls, line):
+        # Split only on the first '?'; a line without one is all setup
+        setup, question, punchline = line.partition('?')
+        if not question:
+            return cls(line, NO_PUNCHLINE)
+        return cls(setup + question, punchline)
+
+    def __repr__(self):
+        return f"Joke({self.setup!r}, {self.punchline!r})"
+
+
+def joke_words(text):
+    """The words of a joke, ignoring case and punctuation"""
+    return WORD.findall(text.casefold())
+
+
+def read_jokes(filename, start=0, corpus=None):
+    """Add the jokes in filename from byte offset start to corpus (a new JokeCorpus if None).
+
+    Returns (corpus, offset reached). Raises ValueError for text that is not UTF-8.
+    """
+    if corpus is None:
+        corpus = JokeCorpus()
+    position = start
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        for line in file:
+            position += len(line)
+            line = line.strip()
+            if line:
+                line.decode('utf-8')  # Only to reject bad text now rather than when it is told
+                corpus.add(line, line.find(b'?') + 1 or NO_SPLIT)
+    return corpus, position
+
+
+class JokeCorpus:
+    """Jokes indexed by id, the joke's position among the non-empty lines of the file.
+
+    All the jokes share one UTF-8 buffer (text); offsets[i] is where joke i
+    starts and splits[i] the byte length of its setup, so a joke costs its text
+    plus 12 bytes, and a Joke record is only made when it is asked for. size is
+    how many bytes of the file were read, so appended() can parse just what has
+    been added since.
+
+    The buffers only ever grow, so appended() adds to them in place: the corpus
+    it returns shares them, and this one keeps seeing just its own count jokes.
+    """
+
+    def __init__(self, jokes=(), filename=None, size=0):
+        self.text = bytearray()
+        self.offsets = array('Q', [0])
+        self.splits = array('I')
+        self.count = 0
+        self.filename = filename
+        self.size = size
+        for joke in jokes:
+            if joke.punchline == NO_PUNCHLINE:
+                self.add(joke.setup.encode('utf-8'), NO_SPLIT)
+            else:
+                setup = joke.setup.encode('utf-8')
+                self.add(setup + joke.punchline.encode('utf-8'), len(setup))
+
+    def add(self, data, split):
+        """Append one joke from its UTF-8 text and setup length (NO_SPLIT: no punchline)"""
+        self.text += data
+        self.offsets.append(len(self.text))
+        self.splits.append(split)
+        self.count += 1
+
+    def extension(self):
+        """A corpus sharing this one's buffers and jokes, for adding more jokes to.
+
+        Only call it on the latest corpus: whatever lies in the buffers past this
+        corpus's jokes (left by an append that failed) is dropped first.
+        """
+        del self.text[self.offsets[self.count]:]
+        del self.offsets[self.count + 1:]
+        del self.splits[self.count:]
+        corpus = JokeCorpus(filename=self.filename, size=self.size)
+        corpus.text, corpus.offsets, corpus.splits = self.text, self.offsets, self.splits
+        corpus.count = self.count
+        return corpus
+
+    @classmethod
+    def load(cls, filename):
+        corpus, size = read_jokes(filename, 0, cls(filename=filename))
+        corpus.size = size
+        return corpus
+
+    def appended(self):
+        """A new corpus with the jokes added to the end of the file since this one was read.
+
+        Only the new lines are parsed, into the shared buffers, so this corpus stays usable meanwhile.
+        """
+        corpus, size = read_jokes(self.filename, self.size, self.extension())
+        corpus.size = size
+        return corpus
+
+    def close(self):
+        pass  # Nothing to release; here so either corpus can be swapped out the same way
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, joke_id):
+        if joke_id < 0:
+            joke_id += self.count
+        if not 0 <= joke_id < self.count:
+            raise IndexError("joke id out of range")
+        start = self.offsets[joke_id]
+        end = self.offsets[joke_id + 1]
+        split = self.splits[joke_id]
+        if split == NO_SPLIT:
+            return Joke(self.text[start:end].decode('utf-8'), NO_PUNCHLINE)
+        return Joke(self.text[start:start + split].decode('utf-8'), self.text[start + split:end].decode('utf-8'))
+
+    def __iter__(self):
+        for joke_id in range(len(self)):
+            yield self[joke_id]
+
+    def random_id(self, rng=random):
+        return rng.randrange(len(self))
+
+    def random_joke(self, rng=random):
+        return self[self.random_id(rng)]
+
+
+# Line-offset index cached next to the joke file: header, then one 8-byte start
+# offset per non-empty line. The header records the size and mtime of the file it
+# describes, so any change to the file makes the index stale.
+INDEX_MAGIC = b'JOKEIDX1'
+INDEX_HEADER = struct.Struct('<8sqqq')  # magic, source size, source mtime_ns, joke count
+
+
+def joke_index_path(filename):
+    return filename + '.idx'
+
+
+def scan_joke_offsets(data, start=0, offsets=None):
+    """Add the start offset of every non-empty line in data[start:] to offsets (a new array if None)"""
+    if offsets is None:
+        offsets = array('Q')
+    position = start
+    end = len(data)
+    while position < end:
+        newline = data.find(b'\n', position)
+        line_end = end if newline < 0 else newline + 1
+        if data[position:line_end].strip():
+            offsets.append(position)
+        position = line_end
+    return offsets
+
+
+def write_joke_index(filename, offsets, source_stat):
+    path = joke_index_path(filename)
+    temp_name = path + '.tmp'
+    with open(temp_name, 'wb') as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, source_stat.st_size, source_stat.st_mtime_ns, len(offsets)))
+        offsets.tofile(file)
+    os.replace(temp_name, path)
+
+
+class MappedJokeCorpus:
+    """Jokes read straight from a memory-mapped file through a cached line-offset index.
+
+    Opening costs the same whatever the size of the file: the index (built once,
+    then reused until the file changes) is mapped rather than read, and a joke is
+    only decoded and split when it is asked for. Same interface as JokeCorpus.
+    """
+
+    def __init__(self, filename, known=None):
+        self.filename = filename
+        self.data = self.map_file(filename)
+        self.size = len(self.data)
+        self.index_map = None
+        self.offsets = self.open_index(known)
+
+    @staticmethod
+    def map_file(filename):
+        with open(filename, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b''  # mmap cannot map an empty file
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def open_index(self, known=None):
+        """The offsets from the cached index if it matches the file, otherwise freshly built ones.
+
+        known is (offsets, size) already worked out for the start of the file, in
+        which case only the rest of it is scanned.
+        """
+        source_stat = os.stat(self.filename)
+        if known is None:
+            offsets = self.cached_offsets(source_stat)
+            if offsets is not None:
+                return offsets
+            known = (array('Q'), 0)
+
+        offsets, start = known
+        scan_joke_offsets(self.data, start, offsets)
+        if source_stat.st_size == self.size:  # Otherwise the file changed after it was mapped
+            try:
+                write_joke_index(self.filename, offsets, source_stat)
+            except OSError:
+                pass  # The index is only a cache; this run uses the offsets just built
+        return offsets
+
+    def cached_offsets(self, source_stat):
+        try:
+            with open(joke_index_path(self.filename), 'rb') as file:
+                index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError: empty file
+            return None
+
+        if len(index_map) >= INDEX_HEADER.size:
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack_from(index_map)
+            if (magic == INDEX_MAGIC and size == self.size == source_stat.st_size
+                    and mtime_ns == source_stat.st_mtime_ns and len(index_map) == INDEX_HEADER.size + 8 * count):
+                self.index_map = index_map
+                return memoryview(index_map)[INDEX_HEADER.size:].cast('Q')
+        index_map.close()
+        return None
+
+    def appended(self):
+        """A new corpus that also covers the lines added to the end of the file since this one was opened"""
+        offsets = array('Q')
+        offsets.frombytes(memoryview(self.offsets).cast('B'))  # Copy the known offsets; only the tail is scanned
+        return MappedJokeCorpus(self.filename, (offsets, self.size))
+
+    @classmethod
+    def load(cls, filename):
+        return cls(filename)
+
+    def close(self):
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+        if self.index_map is not None:
+            self.index_map.close()
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, joke_id):
+        start = self.offsets[joke_id]
+        end = self.data.find(b'\n', start)
+        if end < 0:
+            end = len(self.data)
+        return Joke.parse(self.data[start:end].decode('utf-8').strip())
+
+    def __iter__(self):
+        for joke_id in range(len(self)):
+            yield self[joke_id]
+
+    def random_id(self, rng=random):
+        return rng.randrange(len(self.offsets))
+
+    def random_joke(self, rng=random):
+        return self[self.random_id(rng)]
+
+
+# Compiled corpus written by compile_jokes.py: header, the UTF-8 text of every
+# joke back to back (padded to 8 bytes), count + 1 'Q' start offsets into that
+# text, then one 'I' per joke giving the byte length of its setup (NO_SPLIT for a
+# line kept without a '?'). The header records the size and mtime of the source
+# file, like the offset index, so editing randomJokes.txt makes it stale.
+COMPILED_MAGIC = b'JOKEBIN1'
+COMPILED_HEADER = struct.Struct('<8sqqqq')  # magic, source size, source mtime_ns, joke count, text bytes
+
+
+def compiled_jokes_path(filename):
+    return filename + '.jokes'
+
+
+class CompiledJokeWriter:
+    """Streams jokes into a compiled corpus file; only the offsets and splits are held in memory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_name = path + '.tmp'
+        self.file = open(self.temp_name, 'w+b')  # Readable too, for text()
+        self.file.write(bytes(COMPILED_HEADER.size))  # Filled in by close() once the counts are known
+        self.offsets = array('Q', [0])
+        self.splits = array('I')
+
+    def __len__(self):
+        return len(self.splits)
+
+    def add(self, setup, punchline=None):
+        """Append one joke from its UTF-8 setup and punchline (None: the line had no '?')"""
+        self.file.write(setup)
+        if punchline is None:
+            self.splits.append(NO_SPLIT)
+        else:
+            self.file.write(punchline)
+            self.splits.append(len(setup))
+        self.offsets.append(self.offsets[-1] + len(setup) + len(punchline or b''))
+
+    def text(self, joke_id):
+        """UTF-8 text of a joke already written (setup and punchline run together)"""
+        start = self.offsets[joke_id]
+        self.file.seek(COMPILED_HEADER.size + start)  # Plain seek and read; os.pread is Unix only
+        text = self.file.read(self.offsets[joke_id + 1] - start)
+        self.file.seek(0, os.SEEK_END)  # Back to where add() writes
+        return text
+
+    def close(self, source_stat):
+        text_bytes = self.offsets[-1]
+        self.file.write(bytes(-text_bytes % 8))
+        self.offsets.tofile(self.file)
+        self.splits.tofile(self.file)
+        self.file.seek(0)
+        self.file.write(COMPILED_HEADER.pack(COMPILED_MAGIC, source_stat.st_size, source_stat.st_mtime_ns,
+                                             len(self.splits), text_bytes))
+        self.file.close()
+        os.replace(self.temp_name, self.path)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.temp_name)
+        except OSError:
+            pass  # Already replaced or never created; nothing half-written is left either way
+
+
+class CompiledJokeCorpus:
+    """Jokes from a memory-mapped compiled corpus, already cleaned, deduplicated and split.
+
+    filename is the source text file and size how many bytes of it are covered:
+    the compiled jokes, then any lines appended since (parsed into extra), so the
+    watcher and appended() treat it like the other corpora.
+    """
+
+    def __init__(self, filename, data, extra=None, size=None):
+        self.filename = filename
+        self.data = data
+        _, source_size, _, count, text_bytes = COMPILED_HEADER.unpack_from(data)
+        self.size = source_size if size is None else size
+        view = memoryview(data)
+        text_start = COMPILED_HEADER.size
+        offsets_start = text_start + text_bytes + (-text_bytes % 8)
+        splits_start = offsets_start + 8 * (count + 1)
+        self.text = view[text_start:text_start + text_bytes]
+        self.offsets = view[offsets_start:splits_start].cast('Q')
+        self.splits = view[splits_start:splits_start + 4 * count].cast('I')
+        self.extra = extra if extra is not None else JokeCorpus()  # Lines appended since compiling
+
+    @classmethod
+    def open(cls, filename):
+        """The compiled corpus for filename, or None if there is none or the file changed since"""
+        try:
+            source_stat = os.stat(filename)
+            with open(compiled_jokes_path(filename), 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError: empty file
+            return None
+
+        if len(data) >= COMPILED_HEADER.size:
+            magic, size, mtime_ns, count, text_bytes = COMPILED_HEADER.unpack_from(data)
+            expected = COMPILED_HEADER.size + text_bytes + (-text_bytes % 8) + 8 * (count + 1) + 4 * count
+            if (magic == COMPILED_MAGIC and size == source_stat.st_size
+                    and mtime_ns == source_stat.st_mtime_ns and len(data) == expected):
+                return cls(filename, data)
+        data.close()
+        return None
+
+    @classmethod
+    def load(cls, filename):
+        corpus = cls.open(filename)
+        if corpus is None:
+            raise OSError(f"no up-to-date compiled corpus for {filename}")
+        return corpus
+
+    def appended(self):
+        """A new corpus that also has the lines added to the end of the source file (not deduplicated)"""
+        extra, size = read_jokes(self.filename, self.size, self.extra.extension())
+        with open(compiled_jokes_path(self.filename), 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return CompiledJokeCorpus(self.filename, data, extra, size)
+
+    def close(self):
+        self.splits.release()
+        self.offsets.release()
+        self.text.release()
+        self.data.close()
+
+    def __len__(self):
+        return len(self.splits) + len(self.extra)
+
+    def __getitem__(self, joke_id):
+        if joke_id < 0:
+            joke_id += len(self)
+        if joke_id >= len(self.splits):
+            return self.extra[joke_id - len(self.splits)]
+
+        start = self.offsets[joke_id]
+        end = self.offsets[joke_id + 1]
+        split = self.splits[joke_id]
+        if split == NO_SPLIT:
+            return Joke(str(self.text[start:end], 'utf-8'), NO_PUNCHLINE)
+        return Joke(str(self.text[start:start + split], 'utf-8'), str(self.text[start + split:end], 'utf-8'))
+
+    def __iter__(self):
+        for joke_id in range(len(self)):
+            yield self[joke_id]
+
+    def random_id(self, rng=random):
+        return rng.randrange(len(self))
+
+    def random_joke(self, rng=random):
+        return self[self.random_id(rng)]
+
+
+class JokeIndex:
+    """Inverted index from each word of a joke's setup and punchline to the ids of the jokes using it.
+
+    All the posting lists live in one array, grouped by word and in id order;
+    spans maps a word to where its list starts and how long it is. A lookup is
+    a dict access per form of the word (singular and plural), and picking a
+    random joke about a word used in only one form is one index into the array,
+    with nothing copied.
+    """
+
+    def __init__(self, ids, spans, unused=0):
+        self.ids = ids
+        self.spans = spans
+        self.unused = unused  # Entries of ids no span covers any more (left behind by extended)
+
+    @staticmethod
+    def collect(jokes, joke_ids):
+        """Word -> ids (in order) of the jokes among joke_ids using it"""
+        postings = {}
+        for joke_id in joke_ids:
+            joke = jokes[joke_id]
+            text = joke.setup if joke.punchline == NO_PUNCHLINE else joke.setup + " " + joke.punchline
+            for word in set(joke_words(text)):
+                postings.setdefault(word, []).append(joke_id)
+        return postings
+
+    @classmethod
+    def flatten(cls, postings):
+        # One array for every list, so the lists cost 4 bytes per entry once built
+        ids = array('I')
+        spans = {}
+        for word, joke_ids in postings:
+            spans[word] = (len(ids), len(joke_ids))
+            ids.extend(joke_ids)
+        return cls(ids, spans)
+
+    @classmethod
+    def build(cls, jokes):
+        return cls.flatten(cls.collect(jokes, range(len(jokes))).items())
+
+    def extended(self, jokes, first_new_id):
+        """A new index that also covers jokes[first_new_id:], jokes appended after the ones indexed here.
+
+        Only the new jokes are read. The lists of the words they use are moved to
+        the end of a copy of the array with the new ids after them (still in id
+        order); the array is repacked once more than half of it is left unused.
+        """
+        postings = self.collect(jokes, range(first_new_id, len(jokes)))
+        if not postings:
+            return self
+        ids = array('I', self.ids)
+        spans = dict(self.spans)
+        unused = self.unused
+        for word, joke_ids in postings.items():
+            start, count = spans.get(word, (len(ids), 0))
+            if start + count != len(ids):  # Not already last, so move the list to the end
+                ids.extend(ids[start:start + count])
+                unused += count
+                start = len(ids) - count
+            spans[word] = (start, count + len(joke_ids))
+            ids.extend(joke_ids)
+        if 2 * unused > len(ids):
+            return self.flatten((word, ids[start:start + count]) for word, (start, count) in spans.items())
+        return JokeIndex(ids, spans, unused)
+
+    def spans_for(self, word):
+        """(start, count) of the posting lists of word and of its singular/plural, for those the index has"""
+        word = word.casefold()
+        variants = (word, word[:-1] if word.endswith('s') else word + 's')
+        return [self.spans[variant] for variant in variants if variant in self.spans]
+
+    def postings(self, word):
+        """Ids of the jokes using word or its singular/plural, in id order (empty if there are none).
+
+        When only one form is used this is a read-only view of the index; when both
+        are, their lists are merged into a new one.
+        """
+        spans = self.spans_for(word)
+        if len(spans) == 1:
+            start, count = spans[0]
+            return memoryview(self.ids)[start:start + count].toreadonly()
+        return sorted(set().union(*(self.ids[start:start + count] for start, count in spans)))
+
+    def matching(self, text):
+        """Ids of the jokes using every word of text (each in either form), in id order"""
+        lists = [self.postings(word) for word in set(joke_words(text))]
+        if not lists or not all(map(len, lists)):
+            return []
+        if len(lists) == 1:
+            return lists[0]
+
+        # Start from the shortest list, so the intersection never grows past it
+        lists.sort(key=len)
+        matches = set(lists[0])
+        for ids in lists[1:]:
+            matches.intersection_update(ids)
+        return sorted(matches)
+
+    def random_id(self, text, rng=random):
+        """Id of a random joke using every word of text, or None if there is none"""
+        matches = self.matching(text)  # For one word, the posting list itself
+        return matches[rng.randrange(len(matches))] if len(matches) else None
+
+
+def open_joke_corpus(filename, mapped=False):
+    """The compiled corpus for filename while it is up to date, otherwise the text itself"""
+    compiled = CompiledJokeCorpus.open(filename)
+    if compiled is not None:
+        return compiled
+    # Memory-mapped: only the cached line-offset index is opened and jokes are decoded as they are told
+    return MappedJokeCorpus.load(filename) if mapped else JokeCorpus.load(filename)
+
+
+def tail_checksum(filename, size, length=4096):
+    """(checksum, ends with a newline) of the last length bytes of filename's first size bytes"""
+    start = max(0, size - length)
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(size - start)
+    return zlib.crc32(data), data.endswith(b'\n') or not data
+
+
+class JokeFileWatcher:
+    """Works out from one os.stat per poll whether the joke file was appended to or rewritten.
+
+    watch(corpus) records which file (device and inode) the corpus was read from,
+    how many bytes it covers and a checksum of the last few KB of them. check()
+    then answers None (nothing new), 'append' (only new lines at the end, so
+    corpus.appended() is enough) or 'rebuild' (truncated, replaced or edited, so
+    the whole file must be read again).
+    """
+
+    FINGERPRINT_BYTES = 4096
+
+    def __init__(self, filename, corpus):
+        self.filename = filename
+        self.watch(corpus)
+
+    def watch(self, corpus):
+        self.size = corpus.size
+        source_stat = os.stat(self.filename)
+        self.identity = (source_stat.st_dev, source_stat.st_ino)
+        # Only a file that is still exactly what was read can be judged by its mtime
+        self.mtime_ns = source_stat.st_mtime_ns if source_stat.st_size == self.size else None
+        self.fingerprint = self.read_fingerprint()
+
+    def read_fingerprint(self):
+        """(checksum, ends with a newline) of the last bytes the corpus covers"""
+        return tail_checksum(self.filename, self.size, self.FINGERPRINT_BYTES)
+
+    def check(self):
+        try:
+            source_stat = os.stat(self.filename)
+            if (source_stat.st_dev, source_stat.st_ino) != self.identity or source_stat.st_size < self.size:
+                return 'rebuild'  # Replaced (e.g. saved by an editor) or truncated
+            if source_stat.st_size == self.size:
+                if self.mtime_ns is not None and source_stat.st_mtime_ns != self.mtime_ns:
+                    return 'rebuild'  # Rewritten in place at the same length
+                return None
+
+            # Longer: an append only if what was read is untouched and ended on a complete line
+            checksum, complete = self.read_fingerprint()
+            if checksum != self.fingerprint[0] or not complete:
+                return 'rebuild'
+            return 'append'
+        except OSError:
+            return None  # Briefly missing while being replaced; look again next poll
+
+
+def corpus_stamp(corpus):
+    """(size, mtime_ns, tail checksum, compiled) of the part of the file corpus was read from.
+
+    Saved next to anything keyed by joke id (the deck, the weights), so it can be
+    told later whether the ids still mean the same jokes. mtime_ns is -1 if the
+    file has grown since it was read.
+    """
+    source_stat = os.stat(corpus.filename)
+    mtime_ns = source_stat.st_mtime_ns if source_stat.st_size == corpus.size else -1
+    checksum, _ = tail_checksum(corpus.filename, corpus.size)
+    return corpus.size, mtime_ns, checksum, isinstance(corpus, CompiledJokeCorpus)
+
+
+def stamp_matches(corpus, size, mtime_ns, checksum, compiled):
+    """Whether ids saved with this corpus_stamp still mean the same jokes of corpus.
+
+    They do if the file is unchanged or has only had lines appended since, and
+    the same kind of corpus (compiled or text) is used.
+    """
+    if size > corpus.size or bool(compiled) != isinstance(corpus, CompiledJokeCorpus):
+        return False
+    if size == corpus.size:
+        return mtime_ns == os.stat(corpus.filename).st_mtime_ns  # Same length: unchanged unless touched
+    # Appended to: what was read is unchanged and its last line was already complete
+    tail, complete = tail_checksum(corpus.filename, size)
+    if not complete:
+        with open(corpus.filename, 'rb') as file:
+            file.seek(size)
+            complete = file.read(1) in (b'\n', b'\r')
+    return tail == checksum and complete
+
+
+# Saved deck: header, the Mersenne Twister state (625 words) and the swap map as
+# parallel position/value arrays. The header carries the corpus_stamp of the jokes
+DECK_MAGIC = b'JOKEDCK2'
+# magic, joke count, position, RNG state version, swap count, source size, mtime_ns, tail crc32, compiled
+DECK_HEADER = struct.Struct('<8sqqqqqqIB3x')
+DECK_STATE_WORDS = 625
+
+
+def joke_deck_path(filename):
+    return filename + '.deck'
+
+
+class JokeDeck:
+    """Joke ids in a shuffled order with no repeats until every joke has been told.
+
+    A lazy Fisher-Yates shuffle: the ids are a virtual array 0..count-1 and only
+    positions that have been swapped are stored (in swaps), so a draw is O(1) and
+    adds at most one entry, whatever the size of the corpus. When the deck runs
+    out a new shuffle starts. save/load keep the position across restarts.
+    """
+
+    def __init__(self, count, rng=None):
+        self.rng = rng or random.Random()
+        self.reset(count)
+
+    def reset(self, count=None):
+        """Start a fresh shuffle (of count jokes, if given)"""
+        if count is not None:
+            self.count = count
+        self.position = 0
+        self.swaps = {}  # Position -> id, for positions whose id is not their own number
+
+    def remaining(self):
+        return self.count - self.position
+
+    def draw(self):
+        """Next joke id of the shuffled deck"""
+        if self.count == 0:
+            raise IndexError("draw from an empty deck")
+        if self.position >= self.count:
+            self.reset()
+
+        # Swap a random undrawn position into the current one, Fisher-Yates style
+        position = self.position
+        chosen = self.rng.randrange(position, self.count)
+        joke_id = self.swaps.pop(chosen, chosen)
+        if chosen != position:
+            self.swaps[chosen] = self.swaps.pop(position, position)
+        else:
+            self.swaps.pop(position, None)
+        self.position += 1
+        return joke_id
+
+    def resize(self, count):
+        """Follow a change in the number of jokes: appended jokes join the undrawn part of the deck"""
+        if count >= self.count:
+            self.count = count  # New positions hold their own ids, as the virtual array already implies
+        else:
+            self.reset(count)  # Jokes were removed, so ids drawn so far no longer mean the same jokes
+
+    def save(self, path, corpus):
+        """Save the deck of corpus's jokes, stamped with the part of the file it was read from"""
+        version, state, _ = self.rng.getstate()
+        positions = array('q', self.swaps.keys())
+        values = array('q', self.swaps.values())
+        temp_name = path + '.tmp'
+        with open(temp_name, 'wb') as file:
+            file.write(DECK_HEADER.pack(DECK_MAGIC, self.count, self.position, version, len(positions),
+                                        *corpus_stamp(corpus)))
+            array('Q', state).tofile(file)
+            positions.tofile(file)
+            values.tofile(file)
+        os.replace(temp_name, path)
+
+    @classmethod
+    def load(cls, path, corpus):
+        """The deck saved at path for corpus, or a new one if there is none or it was for other jokes"""
+        count = len(corpus)
+        deck = cls(count)
+        try:
+            with open(path, 'rb') as file:
+                (magic, saved_count, position, version, swap_count,
+                 *stamp) = DECK_HEADER.unpack(file.read(DECK_HEADER.size))
+                state = array('Q')
+                state.fromfile(file, DECK_STATE_WORDS)
+                positions = array('q')
+                positions.fromfile(file, swap_count)
+                values = array('q')
+                values.fromfile(file, swap_count)
+            if magic != DECK_MAGIC or saved_count > count or not stamp_matches(corpus, *stamp):
+                return deck
+        except (OSError, EOFError, struct.error):
+            return deck
+
+        deck.rng.setstate((version, tuple(state), None))
+        deck.count = saved_count
+        deck.position = position
+        deck.swaps = dict(zip(positions, values))
+        deck.resize(count)
+        return deck
+
+
+class AliasTable:
+    """Walker/Vose alias table: draws an id with probability proportional to its weight in O(1).
+
+    Built in O(n) from a snapshot of the weights, which it keeps (weights) so
+    JokeWeights can correct for votes cast since.
+    """
+
+    def __init__(self, weights, prob, alias):
+        self.weights = weights
+        self.prob = prob
+        self.alias = alias
+
+    @classmethod
+    def build(cls, weights):
+        count = len(weights)
+        prob = array('d', [1.0]) * count
+        alias = array('I', range(count))
+        total = sum(weights)  # The only full sum, once per build
+        if count == 0 or total <= 0:
+            return cls(weights, prob, alias)
+
+        # Scale so the average is 1, then pair each short column with a tall one that tops it up
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            short = small.pop()
+            tall = large.pop()
+            prob[short] = scaled[short]
+            alias[short] = tall
+            scaled[tall] += scaled[short] - 1.0
+            (small if scaled[tall] < 1.0 else large).append(tall)
+        # Whatever is left is 1 up to rounding, so keeps its own column (prob 1.0)
+        return cls(weights, prob, alias)
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng=random):
+        column = rng.randrange(len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+
+# Saved weights: header, then one float32 per joke. Like the offset index the
+# header describes the joke file the ids refer to: its size, mtime and a checksum
+# of its tail, and whether the ids were those of the compiled corpus (whose ids
+# differ from the text's once anything was dropped)
+WEIGHTS_MAGIC = b'JOKEWGT2'
+WEIGHTS_HEADER = struct.Struct('<8sqqqqIB3x')  # magic, count, votes, source size, mtime_ns, tail crc32, compiled
+
+
+def joke_weights_path(filename):
+    return filename + '.weights'
+
+
+class JokeWeights:
+    """Per-joke weights from thumbs up/down votes, sampled through an AliasTable.
+
+    A vote only changes one weight. The table is rebuilt in batches (see
+    needs_rebuild) from a snapshot; until then a draw from the old table is
+    accepted with probability (weight now / weight in the table) / ratio, where
+    ratio is at least the largest such quotient among the changed jokes, which
+    keeps the draws exactly in proportion to the current weights.
+
+    Like the deck, draws do not repeat a joke told recently: the last
+    RECENT_JOKES ids (or half the corpus, if smaller) are drawn again instead.
+    """
+
+    UP = 1.5  # A thumbs up multiplies the weight by this, a thumbs down divides by it
+    MIN_WEIGHT = 0.05
+    MAX_WEIGHT = 20.0
+    REBUILD_VOTES = 32  # Rebuild the table after this many votes...
+    MAX_RATIO = 2.0  # ...or once draws could be rejected half the time
+    RECENT_JOKES = 20
+    MAX_REDRAWS = 64  # A handful of heavily weighted jokes could all be recent; then repeat one
+
+    def __init__(self, count, rng=None):
+        self.rng = rng or random.Random()
+        self.generation = 0  # Bumped whenever the jokes change, so tables built before are refused
+        self.reset(count)
+
+    def reset(self, count):
+        """Every joke back to weight 1 with no votes (the ids now mean different jokes)"""
+        self.generation += 1
+        self.weights = array('f', [1.0]) * count
+        self.votes = 0
+        self.table = None
+        self.changed = set()  # Ids whose weight differs from the one in the table
+        self.ratio = 1.0
+        self.voted = set()  # Ids voted on since the last snapshot
+        self.recent = deque()  # Ids drawn lately, oldest first (and as a set, for lookups)
+        self.recent_ids = set()
+
+    def resize(self, count):
+        """Follow a change in the number of jokes: appended jokes start at weight 1"""
+        if count < len(self.weights):
+            self.reset(count)
+            return
+        self.generation += 1
+        self.weights.extend(array('f', [1.0]) * (count - len(self.weights)))
+        self.table = None  # The new jokes are not in it at all
+
+    def vote(self, joke_id, up):
+        weight = self.weights[joke_id] * self.UP if up else self.weights[joke_id] / self.UP
+        self.weights[joke_id] = min(self.MAX_WEIGHT, max(self.MIN_WEIGHT, weight))
+        self.votes += 1
+        self.voted.add(joke_id)
+        if self.table is not None:
+            self.changed.add(joke_id)
+            self.ratio = max(self.ratio, self.weights[joke_id] / self.table.weights[joke_id])
+
+    def needs_rebuild(self):
+        return self.table is None or len(self.changed) >= self.REBUILD_VOTES or self.ratio > self.MAX_RATIO
+
+    def snapshot(self):
+        """(generation, copy of the weights) to build the next table from (on another thread)"""
+        self.voted = set()
+        return self.generation, array('f', self.weights)
+
+    def install(self, table, generation):
+        """Start drawing from table, built from the snapshot of generation.
+
+        Votes cast since that snapshot are corrected for. A table from before the
+        jokes were last reset or resized is dropped, even with the same length.
+        """
+        if generation != self.generation or len(table) != len(self.weights):
+            return  # Built before the jokes changed; another build will follow
+        self.table = table
+        self.changed = {i for i in self.voted if self.weights[i] != table.weights[i]}
+        self.ratio = max([1.0] + [self.weights[i] / table.weights[i] for i in self.changed])
+
+    def draw(self):
+        """Id of a joke drawn in proportion to its weight (needs a table)"""
+        while True:
+            joke_id = self.table.sample(self.rng)
+            if self.ratio == 1.0 and joke_id not in self.changed:
+                return joke_id  # No votes since the table was built
+            quotient = self.weights[joke_id] / self.table.weights[joke_id] if joke_id in self.changed else 1.0
+            if self.rng.random() * self.ratio < quotient:
+                return joke_id
+
+    def sample(self):
+        """Id of a joke drawn by weight among those not told recently (needs a table)"""
+        for _ in range(self.MAX_REDRAWS):
+            joke_id = self.draw()
+            if joke_id not in self.recent_ids:
+                break
+        self.recent.append(joke_id)
+        self.recent_ids.add(joke_id)
+        while len(self.recent) > min(self.RECENT_JOKES, len(self.weights) // 2):
+            self.recent_ids.discard(self.recent.popleft())
+        return joke_id
+
+    def save(self, path, corpus):
+        """Save the weights of corpus's jokes, stamped with the part of the file it was read from"""
+        temp_name = path + '.tmp'
+        with open(temp_name, 'wb') as file:
+            file.write(WEIGHTS_HEADER.pack(WEIGHTS_MAGIC, len(self.weights), self.votes, *corpus_stamp(corpus)))
+            self.weights.tofile(file)
+        os.replace(temp_name, path)
+
+    @classmethod
+    def load(cls, path, corpus):
+        """The weights saved at path for corpus, or all 1 if there are none or they were for other jokes.
+
+        They still apply while stamp_matches; jokes appended since start at weight 1.
+        """
+        weights = cls(len(corpus))
+        try:
+            with open(path, 'rb') as file:
+                (magic, saved_count, votes, size, mtime_ns, checksum,
+                 compiled) = WEIGHTS_HEADER.unpack(file.read(WEIGHTS_HEADER.size))
+                saved = array('f')
+                saved.fromfile(file, saved_count)
+            if (magic != WEIGHTS_MAGIC or saved_count > len(corpus)
+                    or not stamp_matches(corpus, size, mtime_ns, checksum, compiled)):
+                return weights
+        except (OSError, EOFError, struct.error):
+            return weights
+        weights.weights = saved
+        weights.votes = votes
+        weights.resize(len(corpus))
+        return weights
@@ -0,0 +1,255 @@
+"""Joke Teller (Exercise 2) jokes served over HTTP, without Tkinter.
+
+A small asyncio HTTP/1.1 server on localhost that tells the same jokes as the
+Tk assistant, as JSON, plus a load generator to measure it, e.g.
+
+    python joke_server.py serve --port 8080
+    curl http://127.0.0.1:8080/joke
+    python joke_server.py bench --connections 2000 --requests 100000
+
+GET /joke draws the next joke of a shuffled deck (no repeats until every joke has
+been told, like tell_joke); GET /joke?about=chicken picks a random joke using
+that word (every word, for several); GET /joke/<id> returns one joke by id.
+Connections are kept alive, so each client can send many requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import resource  # Unix only; used to allow thousands of open sockets
+except ImportError:
+    resource = None
+
+from joke_core import JokeDeck, JokeIndex, open_joke_corpus
+
+MAX_HEADER_BYTES = 8192
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def raise_open_file_limit(needed):
+    """Lift the soft limit on open files towards needed (as far as the hard limit allows)"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        limit = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+class JokeService:
+    """The joke telling behind the server: a corpus and the deck jokes are drawn from"""
+
+    def __init__(self, jokes):
+        self.jokes = jokes
+        self.deck = JokeDeck(len(jokes))
+        self.topics = JokeIndex.build(jokes)
+
+    def next_joke(self):
+        joke_id = self.deck.draw()
+        return joke_id, self.jokes[joke_id]
+
+    def joke(self, joke_id):
+        return joke_id, self.jokes[joke_id]
+
+    def joke_about(self, topic):
+        joke_id = self.topics.random_id(topic)
+        return None if joke_id is None else self.joke(joke_id)
+
+    def respond(self, method, path):
+        """(status, JSON-able body) for one request"""
+        if method != 'GET':
+            return 405, {'error': "only GET is supported"}
+        if not len(self.jokes):
+            return 404, {'error': "no jokes available"}
+
+        url = urlsplit(path)
+        path = url.path
+        topic = parse_qs(url.query).get('about', [''])[0].strip()
+        if path == '/joke' and topic:
+            found = self.joke_about(topic)
+            if found is None:
+                return 404, {'error': f"no jokes about {topic!r}"}
+            joke_id, joke = found
+        elif path == '/joke':
+            joke_id, joke = self.next_joke()
+        elif path.startswith('/joke/') and path[6:].isdigit() and int(path[6:]) < len(self.jokes):
+            joke_id, joke = self.joke(int(path[6:]))
+        else:
+            return 404, {'error': f"no such joke or path: {path}"}
+        return 200, {'id': joke_id, 'setup': joke.setup, 'punchline': joke.punchline}
+
+
+def http_response(status, body, keep_alive):
+    data = json.dumps(body).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('ascii') + data
+
+
+async def handle_client(service, reader, writer):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError:
+                writer.write(http_response(400, {'error': "headers too large"}, False))
+                break
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break  # Client went away between requests
+
+            lines = head.decode('latin-1').split("\r\n")
+            parts = lines[0].split()
+            if len(parts) != 3:
+                writer.write(http_response(400, {'error': "malformed request line"}, False))
+                break
+            method, path, version = parts
+            headers = {name.strip().lower(): value.strip()
+                       for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+            status, body = service.respond(method, path)
+            writer.write(http_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(lambda r, w: handle_client(service, r, w), host, port,
+                                        limit=MAX_HEADER_BYTES, backlog=4096)
+    port = server.sockets[0].getsockname()[1]
+    print(f"Serving {len(service.jokes)} jokes on http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+async def load_client(host, port, count, latencies, errors):
+    """Send count keep-alive requests over one connection, recording each latency"""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors.append("connect")
+        return
+
+    request = f"GET /joke HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('ascii')
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if not head.startswith(b"HTTP/1.1 200"):
+                errors.append(head.split(b"\r\n", 1)[0].decode('latin-1'))
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def run_load(host, port, connections, requests):
+    """Spread requests over connections concurrent clients; return the measurements"""
+    latencies = []
+    errors = []
+    per_client = [requests // connections + (1 if i < requests % connections else 0) for i in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, count, latencies, errors) for count in per_client if count))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    milliseconds = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed) if elapsed else None,
+        'p50_ms': milliseconds(percentile(latencies, 50)),
+        'p99_ms': milliseconds(percentile(latencies, 99)),
+        'max_ms': milliseconds(latencies[-1] if latencies else None)
+    }
+
+
+def start_server_process(args):
+    """Run 'serve' on a free port in a child process; return (process, port)"""
+    command = [sys.executable, os.path.abspath(__file__), '--file', args.file, 'serve', '--host', args.host, '--port', '0']
+    if args.mapped:
+        command.insert(2, '--mapped')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()  # "Serving N jokes on http://host:port"
+    if not line:
+        raise OSError("joke server failed to start")
+    return process, int(line.rsplit(':', 1)[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve jokes over HTTP and measure the server")
+    parser.add_argument('--file', default='randomJokes.txt', help="joke file (default: randomJokes.txt)")
+    parser.add_argument('--mapped', action='store_true', help="memory-map the joke file instead of reading it all in")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_cmd = commands.add_parser('serve', help="run the joke server")
+    serve_cmd.add_argument('--host', default='127.0.0.1')
+    serve_cmd.add_argument('--port', type=int, default=8080)
+
+    bench = commands.add_parser('bench', help="load-test a joke server (started here unless --port is given)")
+    bench.add_argument('--host', default='127.0.0.1')
+    bench.add_argument('--port', type=int, help="existing server to test")
+    bench.add_argument('--connections', type=int, default=1000, help="concurrent keep-alive connections")
+    bench.add_argument('--requests', type=int, default=50000, help="total requests across all connections")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        raise_open_file_limit(65536)
+        jokes = open_joke_corpus(args.file, args.mapped)
+        try:
+            asyncio.run(serve(JokeService(jokes), args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    raise_open_file_limit(args.connections + 100)
+    process = None
+    port = args.port
+    try:
+        if port is None:
+            process, port = start_server_process(args)
+        result = asyncio.run(run_load(args.host, port, args.connections, args.requests))
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1649 @@
+"""Student Manager (Exercise 3) data layer and command line, without Tkinter.
+
+The Tk app in Exercise3.py drives a StudentDatabase from this module; the same
+database can be used headlessly, e.g.
+
+    python student_core.py view
+    python student_core.py top -n 10
+    python student_core.py sort --by name
+    python student_core.py search smi --fuzzy
+    python student_core.py add 1234 "Jo Bloggs" 12 14 16 70
+    python student_core.py batch changes.txt
+    python student_core.py --sqlite range 40 60
+"""
+import argparse
+import heapq
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from itertools import accumulate, islice
+from operator import add, itemgetter, neg
+
+MAX_TOTAL = 160  # Max 60 coursework + 100 exam = 160
+
+FIELDS = ('code', 'name', 'coursework1', 'coursework2', 'coursework3', 'exam')
+
+# Codes in a file are not held to 1000-9999, but must fit the 'i' arrays they are indexed in
+CODE_LIMIT = 1 << (8 * array('i').itemsize - 1)
+
+# Every total four byte-sized marks can add up to, mapped to its rounded percentage,
+# so whole columns are converted with a single map() instead of one division per student
+PERCENTAGE_TABLE = [round((total / MAX_TOTAL) * 100, 2) for total in range(4 * 255 + 1)]
+
+
+def calculate_percentage(student):
+    total_coursework = student['coursework1'] + student['coursework2'] + student['coursework3']
+    total_marks = total_coursework + student['exam']
+    percentage = (total_marks / MAX_TOTAL) * 100
+    return round(percentage, 2)
+
+
+def total_marks(student):
+    return student['coursework1'] + student['coursework2'] + student['coursework3'] + student['exam']
+
+
+def calculate_grade(percentage):
+    if percentage >= 70:
+        return 'A'
+    elif percentage >= 60:
+        return 'B'
+    elif percentage >= 50:
+        return 'C'
+    elif percentage >= 40:
+        return 'D'
+    else:
+        return 'F'
+
+
+# Values derived from a student's marks, computed once per record by MetricsCache
+StudentMetrics = namedtuple('StudentMetrics', ['total_coursework', 'total_marks', 'percentage', 'grade'])
+
+
+class MetricsCache:
+    """Derived marks per student code, computed on first use and reused until invalidated"""
+
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, student):
+        metrics = self.values.get(student['code'])
+        if metrics is not None:
+            self.hits += 1
+            return metrics
+
+        self.misses += 1
+        total_coursework = student['coursework1'] + student['coursework2'] + student['coursework3']
+        percentage = calculate_percentage(student)
+        metrics = StudentMetrics(total_coursework, total_coursework + student['exam'], percentage, calculate_grade(percentage))
+        self.values[student['code']] = metrics
+        return metrics
+
+    def invalidate(self, code):
+        self.values.pop(code, None)
+
+    def clear(self):
+        self.values.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def parse_student_line(line):
+    """Turn one "code,name,cw1,cw2,cw3,exam" line into a student dict (ValueError if malformed)"""
+    data = line.strip().split(',')
+    if len(data) < 6:
+        raise ValueError(f"expected 6 fields, found {len(data)}")
+
+    student = {
+        'code': int(data[0]),
+        'name': data[1],
+        'coursework1': int(data[2]),
+        'coursework2': int(data[3]),
+        'coursework3': int(data[4]),
+        'exam': int(data[5])
+    }
+    if not -CODE_LIMIT <= student['code'] < CODE_LIMIT:
+        raise ValueError(f"student code {student['code']} is out of range")
+    validate_student(student, check_code=False)
+    return student
+
+
+def validate_student(student, check_code=True):
+    """Raise ValueError with a user-facing message if any field is out of range"""
+    if check_code and not (1000 <= student['code'] <= 9999):
+        raise ValueError("Student code must be between 1000 and 9999")
+    if not student['name']:
+        raise ValueError("Student name is required")
+    if not (0 <= student['coursework1'] <= 20) or not (0 <= student['coursework2'] <= 20) or not (0 <= student['coursework3'] <= 20):
+        raise ValueError("Coursework marks must be between 0 and 20")
+    if not (0 <= student['exam'] <= 100):
+        raise ValueError("Exam mark must be between 0 and 100")
+
+
+def read_student_chunks(filename, chunk_size=10000, errors=None):
+    """Stream a marks file as lists of at most chunk_size student dicts.
+
+    Only one chunk is held in memory at a time. Lines that cannot be parsed are
+    skipped and reported in errors as (line_number, message), as is a header count
+    that does not match the number of records actually read.
+    """
+    if errors is None:
+        errors = []
+
+    with open(filename, 'r') as file:
+        # First line is number of students
+        header = file.readline()
+        try:
+            expected = int(header.strip())
+        except ValueError:
+            errors.append((1, f"invalid student count {header.strip()!r}"))
+            expected = None
+
+        chunk = []
+        count = 0
+        for line_number, line in enumerate(file, start=2):
+            if not line.strip():
+                continue
+            try:
+                chunk.append(parse_student_line(line))
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+                continue
+
+            count += 1
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    if expected is not None and expected != count:
+        errors.append((1, f"header says {expected} students but {count} were read"))
+
+
+def load_students(filename, students, chunk_size=10000, errors=None):
+    """Append every record in filename to students (a list or StudentColumns) and return it"""
+    for chunk in read_student_chunks(filename, chunk_size, errors):
+        students.extend(chunk)
+    return students
+
+
+def format_student_line(student):
+    return f"{student['code']},{student['name']},{student['coursework1']},{student['coursework2']},{student['coursework3']},{student['exam']}\n"
+
+
+def write_students(filename, students):
+    """Write the canonical marks file (count header + one line per student) atomically"""
+    temp_name = filename + '.tmp'
+    with open(temp_name, 'w') as file:
+        file.write(f"{len(students)}\n")
+        for student in students:
+            file.write(format_student_line(student))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_name, filename)  # Readers see either the old file or the new one, never half of it
+
+
+class StudentColumns:
+    """Compact student store: one typed array per column and a shared table of names.
+
+    Behaves like the plain list of student dicts (len, indexing, iteration, append,
+    del) so the GUI can use either, but keeps the marks in unsigned byte arrays and
+    answers highest/lowest/sort questions with whole-column operations.
+    """
+
+    def __init__(self):
+        self.codes = array('i')
+        self.coursework1 = array('B')  # Marks are 0-20 / 0-100 so one byte each
+        self.coursework2 = array('B')
+        self.coursework3 = array('B')
+        self.exam = array('B')
+        self.names = []  # Interned, so repeated names share one string object
+        self.snapshot = None  # Memory-mapped snapshot the columns are read from, if any
+
+    @classmethod
+    def from_records(cls, records):
+        columns = cls()
+        for student in records:
+            columns.append(student)
+        return columns
+
+    @classmethod
+    def from_snapshot(cls, snapshot, codes, marks, names):
+        """Columns that read straight from a mapped snapshot (memoryviews, no copying)"""
+        columns = cls()
+        columns.codes = codes
+        columns.coursework1, columns.coursework2, columns.coursework3, columns.exam = marks
+        columns.names = names
+        columns.snapshot = snapshot
+        return columns
+
+    def make_writable(self):
+        """Copy snapshot columns into ordinary arrays before the first change"""
+        if self.snapshot is None:
+            return
+        for name in ('codes', 'coursework1', 'coursework2', 'coursework3', 'exam'):
+            column = array('i' if name == 'codes' else 'B')
+            column.frombytes(getattr(self, name).cast('B'))
+            setattr(self, name, column)
+        self.names = list(self.names)
+        self.snapshot = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return {
+            'code': self.codes[index],
+            'name': self.names[index],
+            'coursework1': self.coursework1[index],
+            'coursework2': self.coursework2[index],
+            'coursework3': self.coursework3[index],
+            'exam': self.exam[index]
+        }
+
+    def __setitem__(self, index, student):
+        self.make_writable()
+        self.codes[index] = student['code']
+        self.names[index] = sys.intern(student['name'])
+        self.coursework1[index] = student['coursework1']
+        self.coursework2[index] = student['coursework2']
+        self.coursework3[index] = student['coursework3']
+        self.exam[index] = student['exam']
+
+    def __delitem__(self, index):
+        self.make_writable()
+        del self.codes[index]
+        del self.names[index]
+        del self.coursework1[index]
+        del self.coursework2[index]
+        del self.coursework3[index]
+        del self.exam[index]
+
+    def __iter__(self):
+        for index in range(len(self.codes)):
+            yield self[index]
+
+    def append(self, student):
+        self.make_writable()
+        self.codes.append(student['code'])
+        self.names.append(sys.intern(student['name']))
+        self.coursework1.append(student['coursework1'])
+        self.coursework2.append(student['coursework2'])
+        self.coursework3.append(student['coursework3'])
+        self.exam.append(student['exam'])
+
+    def extend(self, students):
+        for student in students:
+            self.append(student)
+
+    def totals(self):
+        """Total marks for every row, summed column by column"""
+        coursework = map(add, map(add, self.coursework1, self.coursework2), self.coursework3)
+        return array('H', map(add, coursework, self.exam))
+
+    def percentages(self):
+        return list(map(PERCENTAGE_TABLE.__getitem__, self.totals()))
+
+    def index_of_highest(self):
+        # Percentage only depends on the total, so the first max total is the first max percentage
+        totals = self.totals()
+        return totals.index(max(totals))
+
+    def index_of_lowest(self):
+        totals = self.totals()
+        return totals.index(min(totals))
+
+
+# Binary snapshot of a marks file: header, then the code and mark columns, then the
+# name offsets and one UTF-8 blob of names. Native byte order; it is a local cache.
+SNAPSHOT_MAGIC = b'SMSNAP01'
+SNAPSHOT_VERSION = 1
+# magic, version, count, source size, source mtime (ns), source CRC-32, padding to 40 bytes
+SNAPSHOT_HEADER = struct.Struct('<8sIIqqI4x')
+
+
+def snapshot_path(filename):
+    return filename + '.snap'
+
+
+def file_crc32(filename):
+    crc = 0
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+class SnapshotNames:
+    """Student names in a snapshot, decoded from the shared UTF-8 blob only when read"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return sys.intern(str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8'))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def write_snapshot(filename, columns, source_stat):
+    """Save columns as the snapshot of filename, stamped with the text file's size, mtime and CRC"""
+    names = [name.encode('utf-8') for name in columns.names]
+    offsets = array('I', accumulate(map(len, names), initial=0))
+
+    temp_name = snapshot_path(filename) + '.tmp'
+    with open(temp_name, 'wb') as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(columns),
+                                        source_stat.st_size, source_stat.st_mtime_ns, file_crc32(filename)))
+        for column in (columns.codes, columns.coursework1, columns.coursework2, columns.coursework3, columns.exam):
+            file.write(column)
+        file.write(offsets)
+        file.write(b''.join(names))
+    os.replace(temp_name, snapshot_path(filename))
+
+
+def read_snapshot(filename):
+    """Memory-map the snapshot of filename as StudentColumns, or return None if it is missing or stale"""
+    try:
+        source_stat = os.stat(filename)
+        with open(snapshot_path(filename), 'rb') as file:
+            snapshot = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # ValueError: empty file
+        return None
+
+    try:
+        magic, version, count, size, mtime_ns, crc = SNAPSHOT_HEADER.unpack_from(snapshot)
+        current = magic == SNAPSHOT_MAGIC and version == SNAPSHOT_VERSION and size == source_stat.st_size
+        # Columns, then count + 1 name offsets, then the names; a cut-off file is just stale
+        names_start = SNAPSHOT_HEADER.size + 8 * count + 4 * (count + 1)
+        if current and (count < 0 or len(snapshot) < names_start
+                        or len(snapshot) != names_start + struct.unpack_from('=I', snapshot, names_start - 4)[0]):
+            current = False
+        if current and mtime_ns != source_stat.st_mtime_ns:
+            current = file_crc32(filename) == crc  # Touched but maybe not changed: compare contents
+    except (struct.error, OSError):
+        current = False
+    if not current:
+        snapshot.close()
+        return None
+
+    view = memoryview(snapshot)
+    offset = SNAPSHOT_HEADER.size
+    codes = view[offset:offset + 4 * count].cast('i')
+    offset += 4 * count
+    marks = []
+    for _ in range(4):
+        marks.append(view[offset:offset + count])
+        offset += count
+    offsets = view[offset:offset + 4 * (count + 1)].cast('I')
+    offset += 4 * (count + 1)
+    return StudentColumns.from_snapshot(snapshot, codes, marks, SnapshotNames(view[offset:], offsets))
+
+
+class CodeIndex:
+    """Student code -> row position for a list of student dicts or a StudentColumns.
+
+    Every add, update and delete goes through the index so lookups, duplicate checks
+    and single-record changes are constant time. Deleting moves the last record into
+    the freed row instead of shifting everything after it down by one.
+    """
+
+    def __init__(self, students):
+        self.students = students
+        self._positions = None
+        self.deletions = 0  # Bumped by every delete, so views of codes can tell they may be stale
+
+    @property
+    def positions(self):
+        # Built on first use, so opening a large cohort does not pay for it up front
+        if self._positions is None:
+            if isinstance(self.students, StudentColumns):
+                self._positions = {code: index for index, code in enumerate(self.students.codes)}
+            else:
+                self._positions = {student['code']: index for index, student in enumerate(self.students)}
+        return self._positions
+
+    def __contains__(self, code):
+        return code in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, code):
+        index = self.positions.get(code)
+        return None if index is None else self.students[index]
+
+    def add(self, student):
+        if student['code'] in self.positions:
+            raise KeyError(f"Student code {student['code']} already exists")
+        self.positions[student['code']] = len(self.students)
+        self.students.append(student)
+
+    def update(self, student):
+        self.students[self.positions[student['code']]] = student
+
+    def delete(self, code):
+        """Remove the record for code and return it"""
+        index = self.positions.pop(code)
+        self.deletions += 1
+        last = len(self.students) - 1
+        student = self.students[index]
+        if index != last:
+            moved = self.students[last]
+            self.students[index] = moved
+            self.positions[moved['code']] = index
+        del self.students[last]
+        return student
+
+
+class StudentJournal:
+    """Append-only log of student changes kept next to the marks file.
+
+    Each add ('A'), update ('U') or delete ('D') is written as one checksummed line
+    and fsync'd before the change counts as saved. compact() folds the journal into
+    the canonical marks file once it reaches the threshold. A torn last line left by
+    a crash fails its checksum and is cut off on the next replay. Several changes
+    saved together are preceded by a "T,<count>" line and only replayed if all of
+    them made it to disk.
+    """
+
+    def __init__(self, filename, threshold=1000):
+        self.filename = filename
+        self.path = filename + '.journal'
+        self.threshold = threshold
+        self.entries = 0
+
+    def append(self, action, student):
+        self.append_many([(action, student)])
+
+    def append_many(self, changes):
+        """Write a list of (action, student) changes with a single write and fsync"""
+        payloads = [f"T,{len(changes)}"] if len(changes) > 1 else []
+        for action, student in changes:
+            if action == 'D':
+                payloads.append(f"D,{student['code']}")
+            else:
+                payloads.append(f"{action},{format_student_line(student).rstrip()}")
+
+        lines = []
+        for payload in payloads:
+            data = payload.encode('utf-8')
+            lines.append(b"%08x," % zlib.crc32(data) + data + b"\n")
+        with open(self.path, 'ab') as file:
+            file.write(b"".join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+        self.entries += len(changes)
+
+    def replay(self, code_index):
+        """Apply every complete journal entry to the loaded students; return how many were applied"""
+        self.entries = 0
+        if not os.path.exists(self.path):
+            return 0
+
+        good_size = 0
+        size = 0
+        batch = []  # Entries of the current "T,<count>" group, applied once it is complete
+        expected = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # Write was cut short by a crash
+                checksum, _, data = line[:-1].partition(b",")
+                if checksum != b"%08x" % zlib.crc32(data):
+                    break
+                size += len(line)
+                fields = data.decode('utf-8').split(',')
+                if fields[0] == 'T':
+                    expected = int(fields[1])
+                    continue
+                batch.append(fields)
+                if len(batch) >= expected:
+                    for fields in batch:
+                        self.apply(fields, code_index)
+                    self.entries += len(batch)
+                    batch = []
+                    expected = 0
+                    good_size = size
+
+        if good_size != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as file:
+                file.truncate(good_size)  # Drop the torn tail so later appends start on a clean line
+        return self.entries
+
+    def apply(self, fields, code_index):
+        # Entries carry whole records, so replaying them again after a compaction is harmless
+        code = int(fields[1])
+        if fields[0] == 'D':
+            if code in code_index:
+                code_index.delete(code)
+            return
+
+        student = {
+            'code': code,
+            'name': fields[2],
+            'coursework1': int(fields[3]),
+            'coursework2': int(fields[4]),
+            'coursework3': int(fields[5]),
+            'exam': int(fields[6])
+        }
+        if code in code_index:
+            code_index.update(student)
+        else:
+            code_index.add(student)
+
+    def compact(self, students):
+        """Rewrite the marks file from the in-memory students and empty the journal"""
+        write_students(self.filename, students)
+        with open(self.path, 'wb') as file:
+            os.fsync(file.fileno())
+        self.entries = 0
+
+
+def sqlite_path(filename):
+    return filename + '.sqlite3'
+
+
+def total_range(low, high):
+    """(smallest, largest) total whose rounded percentage is within low..high, or None"""
+    totals = [total for total in range(MAX_TOTAL + 1) if low <= PERCENTAGE_TABLE[total] <= high]
+    if not totals:
+        return None
+    return totals[0], totals[-1]
+
+
+# ORDER BY for each sort key: the order of its sorted index, then that order reversed
+# (the same choice SortedViews.codes makes)
+SQL_ORDER = {
+    'percentage': ("percentage DESC, code", "percentage, code DESC"),
+    'total': ("percentage DESC, code", "percentage, code DESC"),
+    'name': ("name, code", "name DESC, code DESC"),
+    'code': ("code", "code DESC")
+}
+
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    code INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    coursework1 INTEGER NOT NULL,
+    coursework2 INTEGER NOT NULL,
+    coursework3 INTEGER NOT NULL,
+    exam INTEGER NOT NULL,
+    percentage REAL GENERATED ALWAYS AS ((coursework1 + coursework2 + coursework3 + exam) * 100.0 / 160) VIRTUAL
+);
+CREATE INDEX IF NOT EXISTS students_name ON students (name);
+CREATE INDEX IF NOT EXISTS students_percentage ON students (percentage);
+"""
+
+SQL_UPSERT = """
+INSERT INTO students (code, name, coursework1, coursework2, coursework3, exam) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (code) DO UPDATE SET name = excluded.name, coursework1 = excluded.coursework1,
+    coursework2 = excluded.coursework2, coursework3 = excluded.coursework3, exam = excluded.exam
+"""
+
+
+class SQLiteStore:
+    """Student records in an SQLite database (<marks file>.sqlite3) instead of the text file.
+
+    code is the primary key and name and the computed percentage are indexed, so
+    single-record edits touch one row and sorted, top-N and percentage range
+    queries run in SQL. Each call opens its own connection, so the store can be used
+    from the GUI's I/O thread; WAL mode lets readers work while a change is written.
+    The stored percentage is unrounded; range queries go through total_range so they
+    agree with the rounded percentages shown everywhere else.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SQL_SCHEMA)
+            with connection:  # Commit on success, roll back if anything failed
+                yield connection
+        finally:
+            connection.close()
+
+    def load(self, students):
+        """Append every stored record to students (a list or StudentColumns) and return it"""
+        with self.connect() as connection:
+            rows = connection.execute("SELECT code, name, coursework1, coursework2, coursework3, exam FROM students")
+            students.extend(dict(zip(FIELDS, row)) for row in rows)
+        return students
+
+    def replace_all(self, students):
+        """Replace every stored record with students in one transaction"""
+        with self.connect() as connection:
+            connection.execute("DELETE FROM students")
+            connection.executemany(SQL_UPSERT, map(itemgetter(*FIELDS), students))
+
+    def apply_changes(self, changes):
+        """Write (action, student) changes in one transaction, touching only their rows"""
+        with self.connect() as connection:
+            for action, student in changes:
+                if action == 'D':
+                    connection.execute("DELETE FROM students WHERE code = ?", (student['code'],))
+                else:
+                    connection.execute(SQL_UPSERT, itemgetter(*FIELDS)(student))
+
+    def import_text(self, filename):
+        """Replace the stored records with a marks file; return its (line number, message) errors"""
+        errors = []
+        with self.connect() as connection:
+            connection.execute("DELETE FROM students")
+            for chunk in read_student_chunks(filename, errors=errors):
+                connection.executemany(SQL_UPSERT, map(itemgetter(*FIELDS), chunk))
+        return errors
+
+    def export_text(self, filename):
+        """Write the stored records to filename in the marks file format, in code order"""
+        with self.connect() as connection:
+            rows = connection.execute("SELECT code, name, coursework1, coursework2, coursework3, exam FROM students ORDER BY code")
+            students = [dict(zip(FIELDS, row)) for row in rows]
+        write_students(filename, students)
+
+    def sorted_codes(self, key, reverse=False, limit=None):
+        """Codes in the order StudentDatabase.sorted_students gives for key and reverse"""
+        order = SQL_ORDER[key][reverse != (key in DESCENDING_KEYS)]
+        query = f"SELECT code FROM students ORDER BY {order} LIMIT ?"
+        with self.connect() as connection:
+            return [code for code, in connection.execute(query, (-1 if limit is None else limit,))]
+
+    def codes_in_range(self, low, high):
+        """Codes of students scoring low..high percent, best first"""
+        totals = total_range(low, high)
+        if totals is None:
+            return []
+        bounds = (totals[0] * 100.0 / MAX_TOTAL, totals[1] * 100.0 / MAX_TOTAL)
+        query = "SELECT code FROM students WHERE percentage BETWEEN ? AND ? ORDER BY percentage DESC, code"
+        with self.connect() as connection:
+            return [code for code, in connection.execute(query, bounds)]
+
+    def count_above(self, student):
+        """Number of students with a higher percentage than student"""
+        with self.connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM students WHERE percentage > ?",
+                                      (total_marks(student) * 100.0 / MAX_TOTAL,)).fetchone()[0]
+
+
+class StudentTransaction:
+    """A group of changes to a StudentDatabase that is saved, or rolled back, as one.
+
+    apply() makes each change in memory straight away (raising ValueError, with
+    nothing changed, if it is invalid) and remembers how to undo it. commit()
+    persists the whole group with one write; rollback() restores the records as
+    they were before the first change. Used as a context manager, leaving the block
+    commits and an exception part-way through rolls everything back.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.changes = []  # (action, student) in the order applied
+        self.previous = []  # Record each change replaced (None for an add)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def apply(self, action, student):
+        """Add ('A'), update ('U') or delete ('D', only the code is needed) one student"""
+        previous = self.db.get_by_code(student['code'])
+        student = apply_change(self.db, action, student)
+        self.changes.append((action, student))
+        self.previous.append(previous)
+        return student
+
+    def add(self, student):
+        return self.apply('A', student)
+
+    def update(self, student):
+        return self.apply('U', student)
+
+    def delete(self, code):
+        return self.apply('D', {'code': code})
+
+    def commit(self):
+        """Save every change with a single write and start an empty transaction"""
+        if self.changes:
+            self.db.save_changes(self.changes)
+        self.changes = []
+        self.previous = []
+
+    def rollback(self):
+        """Undo every change not yet committed, newest first"""
+        for (action, student), previous in zip(reversed(self.changes), reversed(self.previous)):
+            if action == 'A':
+                self.db.delete_by_code(student['code'])
+            elif action == 'U':
+                self.db.update_record(previous)
+            else:
+                self.db.add_record(previous)
+        self.changes = []
+        self.previous = []
+
+
+class StudentsByCode:
+    """Read-only sequence of students looked up by code only when an item is asked for.
+
+    Codes deleted since the view was made (e.g. in an open batch edit) are
+    skipped: the view only holds the students still in code_index.
+    """
+
+    def __init__(self, codes, code_index):
+        self.codes = codes
+        self.code_index = code_index
+        self.deletions = code_index.deletions
+
+    def live_codes(self):
+        # Only re-checked after a delete, so reading the view stays one lookup per row
+        if self.deletions != self.code_index.deletions:
+            self.codes = [code for code in self.codes if code in self.code_index]
+            self.deletions = self.code_index.deletions
+        return self.codes
+
+    def __len__(self):
+        return len(self.live_codes())
+
+    def __getitem__(self, index):
+        return self.code_index.get(self.live_codes()[index])
+
+    def __iter__(self):
+        for code in self.live_codes():
+            yield self.code_index.get(code)
+
+
+# Sort keys whose natural order is highest first, and which index serves each key
+# (percentage only depends on the total, so both share one index)
+DESCENDING_KEYS = ('percentage', 'total')
+INDEX_FOR_KEY = {'percentage': 'total', 'total': 'total', 'name': 'name', 'code': 'code'}
+
+SORT_VALUES = {
+    'total': lambda s: -(s['coursework1'] + s['coursework2'] + s['coursework3'] + s['exam']),
+    'name': lambda s: s['name'],
+    'code': lambda s: s['code']
+}
+
+
+class SortedIndex:
+    """(sort value, code) pairs kept in order with bisect as students change"""
+
+    def __init__(self, sort_value, entries):
+        self.sort_value = sort_value
+        self.entries = entries
+
+    def insert(self, student):
+        insort(self.entries, (self.sort_value(student), student['code']))
+
+    def remove(self, student):
+        entry = (self.sort_value(student), student['code'])
+        index = bisect_left(self.entries, entry)
+        if index < len(self.entries) and self.entries[index] == entry:
+            del self.entries[index]
+
+
+# Characters tried when looking for names one typo away from the search text
+SEARCH_ALPHABET = "abcdefghijklmnopqrstuvwxyz '-"
+
+
+def search_keys(name, code):
+    """Keys a student can be found by: whole name, each later word of it (surname) and code"""
+    words = name.casefold().split()
+    keys = {' '.join(words), str(code)}
+    keys.update(words[1:])
+    return keys
+
+
+def one_edit_variants(text):
+    """Every string one deletion, transposition, substitution or insertion away from text"""
+    splits = [(text[:i], text[i:]) for i in range(len(text) + 1)]
+    variants = {left + right[1:] for left, right in splits if right}
+    variants.update(left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1)
+    variants.update(left + c + right[1:] for left, right in splits if right for c in SEARCH_ALPHABET)
+    variants.update(left + c + right for left, right in splits for c in SEARCH_ALPHABET)
+    variants.discard(text)
+    return variants
+
+
+class SearchIndex:
+    """Sorted search keys with the student code each belongs to, for prefix lookups.
+
+    keys and codes are parallel and ordered by (key, code), so a prefix is one
+    bisect away and a change touches only the few keys of that student. Kept
+    current through the same insert/remove calls as the sorted indexes.
+    """
+
+    def __init__(self, names, codes):
+        # The same keys as search_keys gives, built a column at a time: whole names,
+        # codes, then the later words of each name
+        folded = [' '.join(name.casefold().split()) for name in names]
+        later_words = [dict.fromkeys(name.split(' ')[1:]) for name in folded]
+        keys = folded + list(map(str, codes)) + [word for words in later_words for word in words]
+        key_codes = array('i', codes)
+        key_codes.extend(codes)
+        key_codes.extend(code for words, code in zip(later_words, codes) for _ in words)
+
+        # Two stable sorts give (key, code) order without building a tuple per entry
+        order = sorted(range(len(keys)), key=key_codes.__getitem__)
+        order.sort(key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.codes = array('i', [key_codes[i] for i in order])
+
+    @classmethod
+    def for_students(cls, students):
+        """The index over students (a list or StudentColumns)"""
+        if isinstance(students, StudentColumns):
+            return cls(students.names, students.codes)
+        return cls([s['name'] for s in students], [s['code'] for s in students])
+
+    def insert(self, student):
+        for key in search_keys(student['name'], student['code']):
+            low = bisect_left(self.keys, key)
+            index = bisect_left(self.codes, student['code'], low, bisect_right(self.keys, key, low))
+            self.keys.insert(index, key)
+            self.codes.insert(index, student['code'])
+
+    def remove(self, student):
+        for key in search_keys(student['name'], student['code']):
+            low = bisect_left(self.keys, key)
+            high = bisect_right(self.keys, key, low)
+            index = bisect_left(self.codes, student['code'], low, high)
+            if index < high and self.codes[index] == student['code']:
+                del self.keys[index]
+                del self.codes[index]
+
+    def prefix_codes(self, prefix, limit, found):
+        """Add codes whose keys start with prefix to found (a dict used as an ordered set) until it holds limit"""
+        keys = self.keys
+        index = bisect_left(keys, prefix)
+        while index < len(keys) and len(found) < limit and keys[index].startswith(prefix):
+            found.setdefault(self.codes[index])
+            index += 1
+
+    def search(self, text, limit=50, fuzzy=False):
+        """Codes of up to limit students whose name, surname or code starts with text.
+
+        With fuzzy, names that start with something one typo away from text fill
+        any places left after the exact matches.
+        """
+        prefix = ' '.join(text.casefold().split())
+        found = {}
+        self.prefix_codes(prefix, limit, found)
+        if fuzzy and len(prefix) > 2 and not prefix.isdigit():
+            for variant in sorted(one_edit_variants(prefix)):
+                if len(found) >= limit:
+                    break
+                self.prefix_codes(variant, limit, found)
+        return list(found)
+
+
+class SortedViews:
+    """Students pre-sorted by percentage, total, name and code.
+
+    Each index is built the first time its key is asked for and from then on kept
+    current by insert/remove/replace, so reading a sorted order costs only the
+    length of the output.
+    """
+
+    def __init__(self, students, search_index=None):
+        self.students = students
+        self.indexes = {}
+        if search_index is not None:
+            self.indexes['search'] = search_index  # Built ahead, off the Tk thread
+
+    def search_index(self):
+        """The SearchIndex over names and codes, built on first use"""
+        if 'search' not in self.indexes:
+            self.indexes['search'] = SearchIndex.for_students(self.students)
+        return self.indexes['search']
+
+    def index(self, key):
+        name = INDEX_FOR_KEY[key]
+        if name not in self.indexes:
+            self.indexes[name] = SortedIndex(SORT_VALUES[name], self.build_entries(name))
+        return self.indexes[name]
+
+    def build_entries(self, name):
+        students = self.students
+        if isinstance(students, StudentColumns):
+            # Whole-column build: no per-student dicts
+            if name == 'total':
+                values = map(neg, students.totals())
+            elif name == 'name':
+                values = students.names
+            else:
+                values = students.codes
+            return sorted(zip(values, students.codes))
+        return sorted((SORT_VALUES[name](student), student['code']) for student in students)
+
+    def codes(self, key, reverse=False, limit=None):
+        """Student codes in the order sorted(..., reverse=reverse) would give, optionally only the first limit"""
+        entries = self.index(key).entries
+        if reverse != (key in DESCENDING_KEYS):
+            entries = reversed(entries)
+        return [code for _, code in islice(entries, limit)]
+
+    def insert(self, student):
+        for index in self.indexes.values():
+            index.insert(student)
+
+    def remove(self, student):
+        for index in self.indexes.values():
+            index.remove(student)
+
+    def replace(self, old_student, new_student):
+        self.remove(old_student)
+        self.insert(new_student)
+
+
+def select_top_codes(students, k, lowest=False, views=None):
+    """Codes of the k best students by percentage (worst first when lowest).
+
+    Reads the sorted view in O(k) once it has been built; otherwise selects with a
+    heap in O(N log k) rather than sorting everyone.
+    """
+    if views is not None and INDEX_FOR_KEY['percentage'] in views.indexes:
+        return views.codes('percentage', reverse=not lowest, limit=k)
+
+    # Equal totals are ordered by code, as in the sorted view (lowest reverses both)
+    select = heapq.nsmallest if lowest else heapq.nlargest
+    if isinstance(students, StudentColumns):
+        totals = students.totals()
+        codes = students.codes
+        return [codes[index] for index in select(k, range(len(totals)), key=lambda index: (totals[index], -codes[index]))]
+    return [student['code'] for student in select(k, students, key=lambda student: (total_marks(student), -student['code']))]
+
+
+def percentage_rank(students, student, views=None):
+    """1-based rank of student by percentage; students with equal marks share a rank"""
+    if views is not None and INDEX_FOR_KEY['percentage'] in views.indexes:
+        # Entries are (-total, code), so everything before (-total,) scored higher
+        return bisect_left(views.index('percentage').entries, (-total_marks(student),)) + 1
+
+    total = total_marks(student)
+    if isinstance(students, StudentColumns):
+        return sum(map(total.__lt__, students.totals())) + 1
+    return sum(1 for other in students if total_marks(other) > total) + 1
+
+
+STATISTICS_PERCENTILES = (10, 25, 50, 75, 90)
+COMPONENT_MAXIMUMS = {'coursework1': 20, 'coursework2': 20, 'coursework3': 20, 'exam': 100}
+
+
+def cohort_statistics(students):
+    """Percentage and per-component statistics for a list of students or StudentColumns.
+
+    Marks are small integers, so each column is reduced to a histogram in one C-level
+    pass (Counter over an array) and every statistic is then read off at most 161
+    distinct totals instead of looping over the students in Python.
+    """
+    if isinstance(students, StudentColumns):
+        columns = {field: getattr(students, field) for field in COMPONENT_MAXIMUMS}
+    else:
+        columns = {field: array('B', map(itemgetter(field), students)) for field in COMPONENT_MAXIMUMS}
+
+    count = len(columns['exam'])
+    if not count:
+        return None
+
+    coursework = map(add, map(add, columns['coursework1'], columns['coursework2']), columns['coursework3'])
+    total_counts = Counter(map(add, coursework, columns['exam']))
+
+    totals = sorted(total_counts)
+    percentages = [PERCENTAGE_TABLE[total] for total in totals]
+    counts = [total_counts[total] for total in totals]
+    cumulative = list(accumulate(counts))
+
+    mean = sum(p * c for p, c in zip(percentages, counts)) / count
+    variance = sum(c * (p - mean) ** 2 for p, c in zip(percentages, counts)) / count
+
+    def nth_percentage(k):
+        # k-th smallest percentage (0-based), found from the cumulative counts
+        return percentages[bisect_left(cumulative, k + 1)]
+
+    def percentile(q):
+        # Linear interpolation between the two nearest ranks (numpy's default method)
+        position = q / 100 * (count - 1)
+        rank = int(position)
+        lower = nth_percentage(rank)
+        upper = nth_percentage(min(rank + 1, count - 1))
+        return lower + (upper - lower) * (position - rank)
+
+    grades = Counter()
+    for p, c in zip(percentages, counts):
+        grades[calculate_grade(p)] += c
+
+    components = {}
+    for field, maximum in COMPONENT_MAXIMUMS.items():
+        histogram = Counter(columns[field])
+        components[field] = {
+            'mean': sum(mark * c for mark, c in histogram.items()) / count,
+            'histogram': [histogram[mark] for mark in range(maximum + 1)]
+        }
+
+    return {
+        'count': count,
+        'mean': mean,
+        'median': percentile(50),
+        'std': variance ** 0.5,
+        'min': percentages[0],
+        'max': percentages[-1],
+        'percentiles': {q: percentile(q) for q in STATISTICS_PERCENTILES},
+        'grades': {grade: grades[grade] for grade in 'ABCDF'},
+        'components': components
+    }
+
+
+def format_statistics(stats):
+    if stats is None:
+        return "No student records found.\n"
+
+    output = "COHORT STATISTICS\n"
+    output += "=" * 50 + "\n\n"
+    output += f"Number of students: {stats['count']}\n"
+    output += f"Mean percentage: {stats['mean']:.2f}%\n"
+    output += f"Median percentage: {stats['median']:.2f}%\n"
+    output += f"Standard deviation: {stats['std']:.2f}\n"
+    output += f"Lowest / highest: {stats['min']}% / {stats['max']}%\n"
+    output += "Percentiles: " + ", ".join(f"P{q} {value:.2f}%" for q, value in stats['percentiles'].items()) + "\n"
+
+    output += "\nGRADE DISTRIBUTION:\n"
+    for grade, number in stats['grades'].items():
+        output += f"{grade}: {number} ({number / stats['count']:.1%})\n"
+
+    for field, component in stats['components'].items():
+        histogram = component['histogram']
+        maximum = len(histogram) - 1
+        output += f"\n{field.upper()} (mean {component['mean']:.2f}/{maximum}):\n"
+        # The exam is grouped into bands of ten so every histogram stays short
+        width = 1 if maximum <= 20 else 10
+        for start in range(0, maximum + 1, width):
+            number = sum(histogram[start:start + width])
+            label = str(start) if width == 1 else f"{start}-{min(start + width - 1, maximum)}"
+            if number:
+                output += f"  {label:>6}: {number}\n"
+
+    return output
+
+
+MERGE_POLICIES = ('newest', 'highest', 'report')
+
+
+def parse_marks_file(filename):
+    """Parse one marks file into (filename, mtime, rows as tuples, errors); runs in a worker process"""
+    errors = []
+    rows = []
+    for chunk in read_student_chunks(filename, errors=errors):
+        rows.extend(tuple(student[field] for field in FIELDS) for student in chunk)
+    return filename, os.stat(filename).st_mtime, rows, errors
+
+
+def merge_marks_files(filenames, policy='newest', base=(), base_source=None, base_mtime=0.0, workers=None):
+    """Parse filenames in parallel and merge them, on top of base, into one record per code.
+
+    When a code appears more than once the policy decides: 'newest' keeps the record
+    from the most recently modified file, 'highest' keeps the higher total and
+    'report' keeps the first one seen and lists the clash. Returns (students,
+    conflicts, errors) where conflicts are (code, kept source, dropped source) and
+    errors are (filename, line number, message).
+    """
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy: {policy}")
+
+    if len(filenames) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_marks_file, filenames))
+    else:
+        results = [parse_marks_file(filename) for filename in filenames]
+
+    sources = [(base_source, base_mtime, (tuple(student[field] for field in FIELDS) for student in base), [])]
+    sources += results
+    if policy == 'newest':
+        sources.sort(key=lambda source: source[1])  # Later files overwrite earlier ones
+
+    merged = {}  # code -> (row, source); one dict insert per row instead of a scan
+    conflicts = []
+    errors = []
+    for source, _, rows, source_errors in sources:
+        errors.extend((source, number, message) for number, message in source_errors)
+        for row in rows:
+            code = row[0]
+            existing = merged.get(code)
+            if existing is None or policy == 'newest':
+                merged[code] = (row, source)
+            elif policy == 'highest':
+                if sum(row[2:]) > sum(existing[0][2:]):
+                    merged[code] = (row, source)
+            elif row != existing[0]:
+                conflicts.append((code, existing[1], source))
+
+    students = [dict(zip(FIELDS, row)) for row, _ in merged.values()]
+    return students, conflicts, errors
+
+
+class StudentDatabase:
+    """Student records plus the indexes, caches and persistence built around them.
+
+    Holds everything the Student Manager does with data so that the Tk app and the
+    command line share one implementation. Changes go through add_record,
+    update_record and delete_by_code to keep the code index, metrics cache and
+    sorted views in step; save/save_change write them to disk.
+
+    With sqlite the records are stored in <filename>.sqlite3 (imported from the
+    text file the first time) and, while nothing is unsaved, sorted, top-N, range
+    and rank queries are answered in SQL.
+    """
+
+    def __init__(self, filename="studentMarks.txt", compact=False, journal=False, snapshot=False, sqlite=False):
+        self.filename = filename
+        # SQLite mode keeps the records in <filename>.sqlite3; the text file is only imported/exported
+        self.store = SQLiteStore(sqlite_path(filename)) if sqlite else None
+        # Snapshot mode maps <filename>.snap (rebuilt when the text file changes) instead of parsing
+        self.snapshot = snapshot and not sqlite
+        self.compact = compact or self.snapshot  # Typed columns instead of one dict per student
+        # Journal mode appends each change to <filename>.journal instead of rewriting the file
+        self.journal = StudentJournal(filename) if journal and not sqlite else None
+        self.metrics = MetricsCache()  # Percentage/grade per student, invalidated when a record changes
+        self.replace_all([])
+
+    def replace_all(self, students, search_index=None, code_index=None):
+        """Use students (a list or StudentColumns) as the whole cohort and rebuild every index.
+
+        search_index and code_index, if given, are a SearchIndex and CodeIndex
+        already built over students (e.g. on a worker thread).
+        """
+        self.students = students
+        self.sql_current = False  # True while the SQLite store holds exactly these records
+        # Student code -> record, kept in sync with every change
+        self.code_index = CodeIndex(students) if code_index is None else code_index
+        self.sorted_views = SortedViews(students, search_index)  # Sort orders kept current on every change
+        self.metrics.clear()
+
+    def load(self):
+        """Read the marks file (and journal); return the (line number, message) list of skipped lines"""
+        if self.store:
+            return self.load_store()
+
+        if not os.path.exists(self.filename):
+            self.create_sample_data()
+
+        errors = []
+        students = read_snapshot(self.filename) if self.snapshot else None
+        if students is None:
+            # Stream the file in chunks; malformed lines are skipped and returned
+            source_stat = os.stat(self.filename)
+            students = load_students(self.filename, StudentColumns() if self.compact else [], errors=errors)
+            if self.snapshot and not errors:
+                self.refresh_snapshot(students, source_stat)
+        self.replace_all(students)
+
+        # Re-apply changes saved since the marks file was last rewritten. A journal left by a
+        # journal-mode run is replayed in any mode; outside journal mode it is then folded into
+        # the marks file, so a later journal-mode run cannot replay it over newer data
+        journal = self.journal
+        if journal is None and os.path.exists(self.filename + '.journal'):
+            journal = StudentJournal(self.filename)
+        if journal and journal.replay(self.code_index) and (journal is not self.journal
+                                                             or journal.entries >= journal.threshold):
+            journal.compact(self.students)
+        self.sorted_views = SortedViews(self.students)
+        return errors
+
+    def load_store(self):
+        errors = []
+        if not self.store.exists():
+            if not os.path.exists(self.filename):
+                self.create_sample_data()
+            errors = self.store.import_text(self.filename)
+        self.replace_all(self.store.load(StudentColumns() if self.compact else []))
+        self.sql_current = True
+        return errors
+
+    def use_sql(self):
+        """True if queries can go to the SQLite store (it exists and has no unsaved changes)"""
+        return self.store is not None and self.sql_current
+
+    def refresh_snapshot(self, students, source_stat):
+        # Skip if the text file changed while it was being read; the next load will retry
+        if os.stat(self.filename).st_mtime_ns != source_stat.st_mtime_ns:
+            return
+        try:
+            write_snapshot(self.filename, students, source_stat)
+        except OSError:
+            pass  # The snapshot is only a cache; the text file is still the source of truth
+
+    def create_sample_data(self):
+        """Create sample data if file doesn't exist"""
+        sample_data = [
+            "5\n",
+            "1001,John Smith,15,18,17,75\n",
+            "1002,Emily Johnson,19,20,18,88\n",
+            "1003,Michael Brown,12,14,13,62\n",
+            "1004,Sarah Davis,17,16,18,79\n",
+            "1005,David Wilson,14,15,16,70\n"
+        ]
+
+        with open(self.filename, 'w') as file:
+            file.writelines(sample_data)
+
+    def save(self):
+        if self.store:
+            self.store.replace_all(self.students)
+            self.sql_current = True
+        elif self.journal:
+            self.journal.compact(self.students)  # Full rewrite also empties the journal
+        else:
+            write_students(self.filename, self.students)
+
+    def save_change(self, action, student):
+        """Persist one add ('A'), update ('U') or delete ('D') of student"""
+        self.save_changes([(action, student)])
+
+    def save_changes(self, changes):
+        """Persist a list of (action, student) changes with one write (see StudentTransaction)"""
+        if self.store:
+            # Only the changed rows are written. Every unsaved change is saved together
+            # (a single edit, or a whole transaction), so the store matches memory again
+            self.store.apply_changes(changes)
+            self.sql_current = True
+            return
+
+        if not self.journal:
+            self.save()
+            return
+
+        self.journal.append_many(changes)
+        if self.journal.entries >= self.journal.threshold:
+            self.journal.compact(self.students)
+
+    def transaction(self):
+        """Start a StudentTransaction for applying several changes as one"""
+        return StudentTransaction(self)
+
+    def merge_files(self, filenames, policy='newest', workers=None):
+        """Current cohort merged with other marks files, as merge_marks_files returns it; changes nothing"""
+        return merge_marks_files(filenames, policy, self.students, self.filename,
+                                 os.path.getmtime(self.filename), workers)
+
+    def import_files(self, filenames, policy='newest', workers=None):
+        """Merge other marks files into the cohort and return (conflicts, errors); call save to persist"""
+        students, conflicts, errors = self.merge_files(filenames, policy, workers)
+        self.replace_all(StudentColumns.from_records(students) if self.compact else students)
+        return conflicts, errors
+
+    def get_by_code(self, code):
+        """Return the student with this code, or None"""
+        return self.code_index.get(code)
+
+    def add_record(self, student):
+        """Add a new student to the store, code index and sorted views; call save_change to persist"""
+        self.code_index.add(student)
+        self.sorted_views.insert(student)
+        self.sql_current = False
+
+    def update_record(self, student):
+        """Replace the stored record with the same code; call save_change to persist"""
+        old_student = self.code_index.get(student['code'])
+        self.code_index.update(student)
+        self.metrics.invalidate(student['code'])
+        self.sorted_views.replace(old_student, student)
+        self.sql_current = False
+
+    def delete_by_code(self, code):
+        """Remove and return the student with this code (None if missing); call save_change to persist"""
+        if code not in self.code_index:
+            return None
+        self.metrics.invalidate(code)
+        student = self.code_index.delete(code)
+        self.sorted_views.remove(student)
+        self.sql_current = False
+        return student
+
+    def calculate_percentage(self, student):
+        return self.metrics.get(student).percentage
+
+    def average_percentage(self, students=None):
+        if students is None:
+            students = self.students
+        if isinstance(self.students, StudentColumns) and len(students) == len(self.students):
+            # Whole cohort (in any order): average straight from the columns
+            return sum(self.students.percentages()) / len(students)
+        return sum(self.calculate_percentage(s) for s in students) / len(students)
+
+    def highest_student(self):
+        if isinstance(self.students, StudentColumns):
+            return self.students[self.students.index_of_highest()]
+        return max(self.students, key=self.calculate_percentage)
+
+    def lowest_student(self):
+        if isinstance(self.students, StudentColumns):
+            return self.students[self.students.index_of_lowest()]
+        return min(self.students, key=self.calculate_percentage)
+
+    def sorted_codes(self, key, reverse=False, limit=None):
+        if self.use_sql():
+            return self.store.sorted_codes(key, reverse, limit)
+        return self.sorted_views.codes(key, reverse, limit)
+
+    def sorted_students(self, key, reverse=False, limit=None):
+        """Students ordered by 'percentage', 'name', 'code' or 'total' (first limit only, if given)"""
+        return [self.code_index.get(code) for code in self.sorted_codes(key, reverse, limit)]
+
+    def sorted_view(self, key, reverse=False):
+        """Like sorted_students, but records are only looked up as they are used"""
+        return StudentsByCode(self.sorted_codes(key, reverse), self.code_index)
+
+    def search(self, text, limit=50, fuzzy=False):
+        """Students whose name, surname or code starts with text (see SearchIndex.search)"""
+        return [self.code_index.get(code) for code in self.sorted_views.search_index().search(text, limit, fuzzy)]
+
+    def top_students(self, k):
+        """The k students with the highest percentage, best first"""
+        if self.use_sql():
+            return self.sorted_students('percentage', reverse=True, limit=k)
+        return [self.code_index.get(code) for code in select_top_codes(self.students, k, views=self.sorted_views)]
+
+    def bottom_students(self, k):
+        """The k students with the lowest percentage, worst first"""
+        if self.use_sql():
+            return self.sorted_students('percentage', limit=k)
+        return [self.code_index.get(code) for code in select_top_codes(self.students, k, lowest=True, views=self.sorted_views)]
+
+    def bottom_percent(self, percent):
+        """The lowest-scoring percent% of the cohort (at least one student), worst first"""
+        return self.bottom_students(max(1, math.ceil(len(self.students) * percent / 100)))
+
+    def rank_of(self, code):
+        """1-based rank by percentage of the student with this code, or None if there is no such student"""
+        student = self.get_by_code(code)
+        if student is None:
+            return None
+        if self.use_sql():
+            return self.store.count_above(student) + 1
+        return percentage_rank(self.students, student, self.sorted_views)
+
+    def percentage_range(self, low, high):
+        """Students whose percentage is between low and high (inclusive), best first"""
+        if self.use_sql():
+            codes = self.store.codes_in_range(low, high)
+        else:
+            totals = total_range(low, high)
+            if totals is None:
+                return []
+            # The percentage index holds (-total, code), so the range is one slice of it
+            entries = self.sorted_views.index('percentage').entries
+            start = bisect_left(entries, (-totals[1],))
+            end = bisect_left(entries, (-totals[0] + 1,))
+            codes = [code for _, code in entries[start:end]]
+        return [self.code_index.get(code) for code in codes]
+
+    def export_text(self, filename):
+        """Write the cohort to filename in the marks file format"""
+        if self.use_sql():
+            self.store.export_text(filename)
+        else:
+            write_students(filename, self.students)
+
+    def statistics(self):
+        return cohort_statistics(self.students)
+
+    def format_student(self, student):
+        metrics = self.metrics.get(student)
+
+        output = f"Student Name: {student['name']}\n"
+        output += f"Student Number: {student['code']}\n"
+        output += f"Total Coursework: {metrics.total_coursework}/60\n"
+        output += f"Exam Mark: {student['exam']}/100\n"
+        output += f"Overall Percentage: {metrics.percentage}%\n"
+        output += f"Grade: {metrics.grade}\n"
+        output += "-" * 50 + "\n"
+
+        return output
+
+    def summary(self, students=None):
+        if students is None:
+            students = self.students
+
+        output = f"\nSUMMARY:\n"
+        output += f"Number of students: {len(students)}\n"
+        output += f"Average percentage: {self.average_percentage(students):.2f}%\n"
+        return output
+
+
+def read_changes(filename):
+    """Yield (action, student) pairs from a batch file of A/U/D lines.
+
+    "A,code,name,cw1,cw2,cw3,exam" adds, "U,..." with the same fields updates and
+    "D,code" deletes; blank lines and lines starting with # are ignored.
+    """
+    with open(filename, 'r') as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            action, _, rest = line.partition(',')
+            action = action.upper()
+            try:
+                if action == 'D':
+                    yield action, {'code': int(rest)}
+                elif action in ('A', 'U'):
+                    yield action, parse_student_line(rest)
+                else:
+                    raise ValueError(f"unknown action {action!r}")
+            except ValueError as e:
+                raise ValueError(f"{filename} line {line_number}: {e}") from None
+
+
+def apply_change(db, action, student):
+    """Apply one add/update/delete to db, raising ValueError if it cannot be done"""
+    code = student['code']
+    if action == 'D':
+        deleted = db.delete_by_code(code)
+        if deleted is None:
+            raise ValueError(f"No student with code {code}")
+        return deleted
+
+    validate_student(student)
+    if action == 'A' and code in db.code_index:
+        raise ValueError("Student code already exists")
+    if action == 'U' and code not in db.code_index:
+        raise ValueError(f"No student with code {code}")
+
+    if action == 'A':
+        db.add_record(student)
+    else:
+        db.update_record(student)
+    return student
+
+
+def print_records(db, title, students):
+    print(title)
+    print("=" * 50 + "\n")
+    for student in students:
+        print(db.format_student(student), end="")
+    if len(students):
+        print(db.summary(students), end="")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Student Manager without the GUI")
+    parser.add_argument('--file', default="studentMarks.txt", help="marks file (default: studentMarks.txt)")
+    parser.add_argument('--compact', action='store_true', help="store marks in typed columns")
+    parser.add_argument('--journal', action='store_true', help="append changes to a journal instead of rewriting the file")
+    parser.add_argument('--snapshot', action='store_true', help="start from a memory-mapped binary snapshot of the file")
+    parser.add_argument('--sqlite', action='store_true',
+                        help="keep the records in FILE.sqlite3 (imported from FILE the first time)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    view = commands.add_parser('view', help="show all students, or one with --code")
+    view.add_argument('--code', type=int)
+
+    top = commands.add_parser('top', help="show the highest (or --bottom lowest) scoring students")
+    top.add_argument('-n', type=int, default=10, help="number of students (default: 10)")
+    top.add_argument('--bottom', action='store_true', help="lowest scoring instead of highest")
+    top.add_argument('--percent', type=float, help="bottom PERCENT%% of the cohort instead of -n students")
+
+    sort = commands.add_parser('sort', help="show students in sorted order")
+    sort.add_argument('--by', choices=['percentage', 'name', 'code', 'total'], default='percentage')
+    sort.add_argument('--reverse', action='store_true', help="reverse the default order")
+    sort.add_argument('--limit', type=int)
+
+    range_cmd = commands.add_parser('range', help="show students scoring between LOW and HIGH percent")
+    range_cmd.add_argument('low', type=float)
+    range_cmd.add_argument('high', type=float)
+
+    search = commands.add_parser('search', help="find students by the start of their name, surname or code")
+    search.add_argument('text')
+    search.add_argument('--fuzzy', action='store_true', help="also match names one typo away")
+    search.add_argument('--limit', type=int, default=50)
+
+    add_cmd = commands.add_parser('add', help="add a student")
+    update_cmd = commands.add_parser('update', help="replace a student's name and marks")
+    for command in (add_cmd, update_cmd):
+        command.add_argument('code', type=int)
+        command.add_argument('name')
+        command.add_argument('coursework1', type=int)
+        command.add_argument('coursework2', type=int)
+        command.add_argument('coursework3', type=int)
+        command.add_argument('exam', type=int)
+
+    delete = commands.add_parser('delete', help="delete a student")
+    delete.add_argument('code', type=int)
+
+    commands.add_parser('report', help="cohort summary and statistics")
+
+    export = commands.add_parser('export', help="write the records to a file in the marks file format")
+    export.add_argument('output')
+
+    batch = commands.add_parser('batch', help="apply a file of A/U/D change lines and save once")
+    batch.add_argument('changes')
+
+    import_cmd = commands.add_parser('import', help="merge other marks files into this one")
+    import_cmd.add_argument('files', nargs='+')
+    import_cmd.add_argument('--policy', choices=MERGE_POLICIES, default='newest',
+                            help="on duplicate codes keep the newest file's record, the highest marks, or the first and report")
+    import_cmd.add_argument('--workers', type=int, help="parser processes (default: one per CPU)")
+
+    args = parser.parse_args(argv)
+
+    db = StudentDatabase(args.file, compact=args.compact, journal=args.journal, snapshot=args.snapshot, sqlite=args.sqlite)
+    try:
+        for number, message in db.load():
+            print(f"Warning: {args.file} line {number}: {message}", file=sys.stderr)
+
+        if args.command == 'view':
+            if args.code is None:
+                print_records(db, "ALL STUDENT RECORDS", db.students)
+            else:
+                student = db.get_by_code(args.code)
+                if student is None:
+                    raise ValueError(f"No student with code {args.code}")
+                print_records(db, "INDIVIDUAL STUDENT RECORD", [student])
+
+        elif args.command == 'top':
+            if args.percent is not None:
+                print_records(db, f"BOTTOM {args.percent:g}% BY PERCENTAGE", db.bottom_percent(args.percent))
+            elif args.bottom:
+                print_records(db, f"BOTTOM {args.n} BY PERCENTAGE", db.bottom_students(args.n))
+            else:
+                print_records(db, f"TOP {args.n} BY PERCENTAGE", db.top_students(args.n))
+
+        elif args.command == 'sort':
+            reverse = (args.by in DESCENDING_KEYS) != args.reverse
+            students = db.sorted_students(args.by, reverse=reverse, limit=args.limit)
+            print_records(db, f"SORTED STUDENT RECORDS ({args.by.upper()})", students)
+
+        elif args.command == 'range':
+            students = db.percentage_range(args.low, args.high)
+            print_records(db, f"STUDENTS SCORING {args.low:g}% TO {args.high:g}%", students)
+
+        elif args.command == 'search':
+            students = db.search(args.text, args.limit, args.fuzzy)
+            print_records(db, f"STUDENTS MATCHING '{args.text}'", students)
+
+        elif args.command in ('add', 'update', 'delete'):
+            action = args.command[0].upper()  # 'A', 'U' or 'D'
+            if action == 'D':
+                student = {'code': args.code}
+            else:
+                student = {field: getattr(args, field) for field in ('code', 'name', 'coursework1', 'coursework2', 'coursework3', 'exam')}
+            student = apply_change(db, action, student)
+            db.save_change(action, student)
+            print(f"Student {args.code} {args.command.rstrip('e')}ed")
+
+        elif args.command == 'report':
+            if not db.students:
+                print("No student records found.")
+            else:
+                highest = db.highest_student()
+                lowest = db.lowest_student()
+                print(db.summary(), end="")
+                print(f"Highest: {highest['name']} ({highest['code']}) {db.calculate_percentage(highest)}%")
+                print(f"Lowest: {lowest['name']} ({lowest['code']}) {db.calculate_percentage(lowest)}%\n")
+                print(format_statistics(db.statistics()), end="")
+
+        elif args.command == 'export':
+            db.export_text(args.output)
+            print(f"Wrote {len(db.students)} students to {args.output}")
+
+        elif args.command == 'batch':
+            changes = list(read_changes(args.changes))
+            # All or nothing: an invalid change rolls back the ones before it
+            with db.transaction() as transaction:
+                for action, student in changes:
+                    transaction.apply(action, student)
+            print(f"Applied {len(changes)} changes to {args.file}")
+
+        elif args.command == 'import':
+            conflicts, errors = db.import_files(args.files, args.policy, args.workers)
+            for filename, number, message in errors:
+                print(f"Warning: {filename} line {number}: {message}", file=sys.stderr)
+            for code, kept, dropped in conflicts:
+                print(f"Conflict: code {code} in {dropped} differs from {kept}; kept {kept}")
+            db.save()
+            print(f"{args.file} now holds {len(db.students)} students")
+
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Tests for compile_jokes"""
+import pytest
+
+from compile_jokes import HashTable, compile_jokes
+from joke_core import NO_PUNCHLINE, CompiledJokeCorpus, JokeCorpus, open_joke_corpus
+
+SOURCE = """Why did the chicken cross the road? To get to the other side.
+WHY did the chicken cross the road?!   To get to the other side
+Why did the chicken cross the busy road? To get to the other side.
+
+What do you call a fish with no eyes? A fsh.
+A line without a question mark
+Nothing after the question mark?
+Why was the math book sad? It had too many problems.
+"""
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'jokes.txt'
+    path.write_text(SOURCE)
+    return str(path)
+
+
+def told(corpus):
+    return [(joke.setup, joke.punchline) for joke in corpus]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_compiler_drops_duplicates_and_malformed_lines(source, tmp_path, workers):
+    rejects = str(tmp_path / 'rejects.tsv')
+    counts = compile_jokes(source, rejects=rejects, workers=workers)
+    assert (counts['lines'], counts['jokes'], counts['blank']) == (8, 3, 1)
+    with open(rejects) as file:
+        assert [line.split('\t')[:2] for line in file] == [
+            ['2', 'duplicate'], ['3', 'near-duplicate'], ['6', 'no-question-mark'], ['7', 'empty-punchline']]
+
+    corpus = open_joke_corpus(source)
+    assert isinstance(corpus, CompiledJokeCorpus)
+    assert told(corpus) == [("Why did the chicken cross the road?", "To get to the other side."),
+                            ("What do you call a fish with no eyes?", "A fsh."),
+                            ("Why was the math book sad?", "It had too many problems.")]
+    corpus.close()
+
+
+def test_compiler_options(source):
+    counts = compile_jokes(source, keep_malformed=True, near=False)
+    assert (counts['jokes'], counts['no-question-mark'], counts['near-duplicate']) == (6, 1, 0)
+    corpus = CompiledJokeCorpus.load(source)
+    assert told(corpus)[3:5] == [("A line without a question mark", NO_PUNCHLINE),
+                                 ("Nothing after the question mark?", NO_PUNCHLINE)]
+    corpus.close()
+
+
+def test_compiled_corpus_goes_stale_when_the_source_changes(source):
+    compile_jokes(source)
+    with open(source, 'a') as file:
+        file.write("One more? Joke.\n")
+    assert isinstance(open_joke_corpus(source), JokeCorpus)
+
+
+def test_hash_table_keeps_every_key_as_it_grows():
+    table = HashTable('Q', 'I', capacity=8)
+    keys = [(i * 0x9E3779B97F4A7C15) % (1 << 64) or 1 for i in range(1, 200)]
+    for value, key in enumerate(keys):
+        table.fill(table.slots((key,)), (key,), value)
+    assert len(table) == len(keys) and len(table.keys) == 512
+    assert [table.values[i] for i in table.slots(keys)] == list(range(len(keys)))
+
+    seen = HashTable('Q')
+    assert seen.add(keys[0]) and not seen.add(keys[0])
+    slots = seen.slots([keys[1], keys[1], keys[2]])
+    seen.fill(slots, [keys[1], keys[1], keys[2]])  # A repeated key in one call is stored once
+    assert len(seen) == 3
@@ -0,0 +1,265 @@
+"""Tests for joke_core"""
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from joke_core import (NO_PUNCHLINE, AliasTable, Joke, JokeCorpus, JokeDeck, JokeFileWatcher, JokeIndex, JokeWeights,
+                       MappedJokeCorpus, read_jokes)
+
+
+def frequencies(draw, count, samples):
+    counts = Counter(draw() for _ in range(samples))
+    return [counts[i] / samples for i in range(count)]
+
+
+def test_read_jokes_splits_on_the_first_question_mark(tmp_path):
+    path = tmp_path / 'jokes.txt'
+    path.write_bytes("Why? Because? Yes\nNo question here\n\nCafé?Olé".encode('utf-8'))
+    corpus, position = read_jokes(str(path), corpus=JokeCorpus())
+    assert position == path.stat().st_size
+    assert [(joke.setup, joke.punchline) for joke in corpus] == [
+        ("Why?", " Because? Yes"), ("No question here", "(Punchline not available)"), ("Café?", "Olé")]
+
+
+def test_corpus_looks_jokes_up_by_id():
+    corpus = JokeCorpus()
+    corpus.add("Knock knock?Who's there".encode('utf-8'), len("Knock knock?"))
+    corpus.add(b"Just a setup", 0xFFFFFFFF)
+    assert len(corpus) == 2
+    assert corpus[-2].punchline == "Who's there"
+    assert corpus[1].setup == "Just a setup"
+    assert corpus.random_id(random.Random(1)) in (0, 1)
+
+
+def test_deck_tells_every_joke_once_per_round():
+    deck = JokeDeck(50, random.Random(5))
+    for _ in range(3):
+        assert sorted(deck.draw() for _ in range(50)) == list(range(50))
+    assert deck.remaining() == 0
+
+
+def test_deck_resize_adds_new_jokes_to_the_current_round():
+    deck = JokeDeck(10, random.Random(6))
+    first = [deck.draw() for _ in range(4)]
+    deck.resize(15)
+    rest = [deck.draw() for _ in range(11)]
+    assert sorted(first + rest) == list(range(15))
+
+    deck.resize(5)  # Removed jokes start a fresh round
+    assert sorted(deck.draw() for _ in range(5)) == list(range(5))
+
+
+def joke_file(tmp_path, count, name='jokes.txt'):
+    path = tmp_path / name
+    path.write_text("".join(f"Joke {i}?Punchline {i}\n" for i in range(count)))
+    return str(path)
+
+
+def test_deck_save_and_load_resume_the_same_round(tmp_path):
+    path = str(tmp_path / 'jokes.deck')
+    corpus = JokeCorpus.load(joke_file(tmp_path, 30))
+    deck = JokeDeck(30, random.Random(7))
+    told = [deck.draw() for _ in range(12)]
+    deck.save(path, corpus)
+    expected = [deck.draw() for _ in range(18)]
+
+    resumed = JokeDeck.load(path, corpus)
+    assert [resumed.draw() for _ in range(18)] == expected
+    assert sorted(told + expected) == list(range(30))
+
+
+def test_saved_deck_is_dropped_once_the_jokes_change(tmp_path):
+    path = str(tmp_path / 'jokes.deck')
+    filename = joke_file(tmp_path, 30)
+    deck = JokeDeck(30, random.Random(9))
+    for _ in range(5):
+        deck.draw()
+    deck.save(path, JokeCorpus.load(filename))
+
+    with open(filename, 'a') as file:
+        file.write("Joke 30?Punchline 30\n")
+    assert JokeDeck.load(path, JokeCorpus.load(filename)).position == 5  # Appended: carries on
+
+    with open(filename, 'w') as file:  # Rewritten with more jokes than before
+        file.write("".join(f"Other {i}?Punchline {i}\n" for i in range(40)))
+    assert JokeDeck.load(path, JokeCorpus.load(filename)).position == 0
+
+
+
+def test_index_matches_both_singular_and_plural():
+    jokes = [Joke("Why do cats purr?", "Cat reasons."), Joke("A dog?", "Dogs bark."), Joke("Cats?", "Yes")]
+    index = JokeIndex.build(jokes)
+    assert list(index.matching("cat")) == [0, 2]
+    assert list(index.matching("cats")) == [0, 2]
+    assert list(index.matching("DOG")) == [1]
+    assert list(index.matching("cat purr")) == [0]
+    assert list(index.matching("cat dog")) == []
+    assert index.random_id("horse") is None
+
+
+def rebuild_table(weights):
+    generation, snapshot = weights.snapshot()
+    weights.install(AliasTable.build(snapshot), generation)
+
+
+def test_alias_table_samples_in_proportion_to_the_weights():
+    weights = [1.0, 2.0, 3.0, 0.0, 4.0]
+    table = AliasTable.build(weights)
+    rng = random.Random(1)
+    observed = frequencies(lambda: table.sample(rng), len(weights), 50000)
+    for weight, frequency in zip(weights, observed):
+        assert frequency == pytest.approx(weight / sum(weights), abs=0.01)
+    assert observed[3] == 0
+
+
+def test_alias_table_of_equal_or_no_weights():
+    table = AliasTable.build([2.0] * 4)
+    assert list(table.prob) == [1.0] * 4
+    assert len(AliasTable.build([])) == 0
+
+
+def test_weights_follow_votes_cast_after_the_table_was_built():
+    weights = JokeWeights(4, random.Random(2))
+    rebuild_table(weights)
+    weights.vote(0, up=True)
+    weights.vote(1, up=False)
+    assert not weights.needs_rebuild()  # Still drawing from the table built before the votes
+
+    expected = [1.5, 1 / 1.5, 1.0, 1.0]
+    observed = frequencies(weights.draw, 4, 50000)
+    for weight, frequency in zip(expected, observed):
+        assert frequency == pytest.approx(weight / sum(expected), abs=0.01)
+
+
+def test_weighted_draws_skip_recent_jokes():
+    weights = JokeWeights(100, random.Random(3))
+    for _ in range(10):
+        weights.vote(7, up=True)  # Heavily favoured, but still not told twice in a row
+    rebuild_table(weights)
+    drawn = [weights.sample() for _ in range(2000)]
+    for i in range(len(drawn)):
+        window = drawn[max(0, i - JokeWeights.RECENT_JOKES):i]
+        assert drawn[i] not in window
+    assert Counter(drawn).most_common(1)[0][0] == 7
+
+
+def test_weighted_draws_from_a_tiny_corpus():
+    weights = JokeWeights(2, random.Random(4))
+    rebuild_table(weights)
+    drawn = [weights.sample() for _ in range(20)]
+    assert all(a != b for a, b in zip(drawn, drawn[1:]))  # The window is half the corpus
+
+
+def test_table_built_before_a_reset_is_not_installed():
+    weights = JokeWeights(4, random.Random(5))
+    for _ in range(8):
+        weights.vote(0, up=True)
+    generation, snapshot = weights.snapshot()
+    weights.reset(4)  # The joke file was rewritten with as many jokes
+    weights.install(AliasTable.build(snapshot), generation)
+    assert weights.table is None
+
+    weights.vote(2, up=True)
+    assert weights.needs_rebuild()
+    rebuild_table(weights)
+    observed = frequencies(weights.draw, 4, 20000)
+    assert observed[0] == pytest.approx(1 / 4.5, abs=0.02)
+    assert observed[2] == pytest.approx(1.5 / 4.5, abs=0.02)
+
+
+def test_extended_index_matches_a_full_build():
+    rng = random.Random(8)
+    words = ["cat", "cats", "dog", "road", "chicken", "cross", "why", "pirate"]
+    jokes = [Joke(" ".join(rng.choices(words, k=3)) + "?", rng.choice(words)) for _ in range(400)]
+    index = JokeIndex.build(jokes[:50])
+    indexed = 50
+    while indexed < len(jokes):
+        count = min(len(jokes), indexed + rng.randint(1, 40))
+        index = index.extended(jokes[:count], indexed)
+        indexed = count
+
+    full = JokeIndex.build(jokes)
+    assert index.spans.keys() == full.spans.keys()
+    for word in words:
+        assert list(index.postings(word)) == list(full.postings(word))
+    assert len(index.ids) <= 2 * len(full.ids)  # Repacked as lists move to the end
+
+
+def test_appended_corpus_shares_the_buffer_and_leaves_the_old_one_as_it_was(tmp_path):
+    path = tmp_path / 'jokes.txt'
+    path.write_bytes(b"One?1\nTwo?2\n")
+    corpus = JokeCorpus.load(str(path))
+    with open(path, 'ab') as file:
+        file.write(b"Three?3\n")
+    newer = corpus.appended()
+    assert newer.text is corpus.text  # Nothing copied
+    assert [joke.setup for joke in newer] == ["One?", "Two?", "Three?"]
+    assert len(corpus) == 2 and [joke.setup for joke in corpus] == ["One?", "Two?"]
+    with pytest.raises(IndexError):
+        corpus[2]
+
+    # An append that fails part-way leaves nothing behind for the next one
+    with open(path, 'ab') as file:
+        file.write(b"Four?4\n\xff?bad\n")
+    with pytest.raises(ValueError):
+        newer.appended()
+    with open(path, 'wb') as file:
+        file.write(b"One?1\nTwo?2\nThree?3\nFour?4\nFive?5\n")
+    newest = newer.appended()
+    assert [joke.punchline for joke in newest] == ["1", "2", "3", "4", "5"]
+    assert len(newer) == 3
+
+
+def test_mapped_corpus_reads_the_same_jokes_through_a_cached_index(tmp_path):
+    path = tmp_path / 'jokes.txt'
+    path.write_bytes("First?One\n\n   \nSecond, no question\nCafé?Olé".encode('utf-8'))
+    expected = [(joke.setup, joke.punchline) for joke in JokeCorpus.load(str(path))]
+
+    for cached in (False, True):  # The first open writes jokes.txt.idx, the second maps it
+        corpus = MappedJokeCorpus.load(str(path))
+        assert (corpus.index_map is not None) == cached
+        assert [(joke.setup, joke.punchline) for joke in corpus] == expected
+        assert len(corpus) == 3 and corpus[1].punchline == NO_PUNCHLINE
+        corpus.close()
+
+    path.write_bytes(b"Only?One\n")  # The index no longer matches the file
+    corpus = MappedJokeCorpus.load(str(path))
+    assert corpus.index_map is None and [joke.setup for joke in corpus] == ["Only?"]
+    with open(path, 'ab') as file:
+        file.write(b"Two?2\n")
+    newer = corpus.appended()
+    assert [joke.punchline for joke in newer] == ["One", "2"] and len(corpus) == 1
+    newer.close()
+    corpus.close()
+
+
+def test_watcher_tells_appends_from_rewrites(tmp_path):
+    path = tmp_path / 'jokes.txt'
+    path.write_bytes(b"One?1\nTwo?2\n")
+    watcher = JokeFileWatcher(str(path), JokeCorpus.load(str(path)))
+    assert watcher.check() is None
+
+    with open(path, 'ab') as file:
+        file.write(b"Three?3\n")
+    assert watcher.check() == 'append'
+    watcher.watch(JokeCorpus.load(str(path)))
+    assert watcher.check() is None
+
+    with open(path, 'r+b') as file:  # Edited in place, then appended to
+        file.write(b"Uno")
+        file.seek(0, os.SEEK_END)
+        file.write(b"Four?4\n")
+    assert watcher.check() == 'rebuild'
+
+    path.write_bytes(b"One?1")
+    watcher.watch(JokeCorpus.load(str(path)))
+    with open(path, 'ab') as file:
+        file.write(b"\nTwo?2\n")  # The last line read was still being written
+    assert watcher.check() == 'rebuild'
+
+    path.unlink()
+    assert watcher.check() is None  # Missing for a moment while being replaced
+    path.write_bytes(b"One?1\n")
+    assert watcher.check() == 'rebuild'
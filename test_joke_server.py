@@ -0,0 +1,50 @@
+"""Tests for joke_server"""
+import asyncio
+import json
+
+from joke_core import Joke
+from joke_server import JokeService, handle_client, run_load
+
+JOKES = [Joke("Why did the chicken cross the road?", "To get to the other side."),
+         Joke("What do you call a fish with no eyes?", "A fsh."),
+         Joke("Why was the chicken a comedian?", "It had egg-cellent timing.")]
+
+
+def test_service_answers_each_path():
+    service = JokeService(JOKES)
+    told = [service.respond('GET', '/joke') for _ in range(3)]
+    assert sorted(body['id'] for status, body in told) == [0, 1, 2]  # A whole deck before any repeat
+
+    assert service.respond('GET', '/joke/1') == (200, {'id': 1, 'setup': JOKES[1].setup,
+                                                       'punchline': JOKES[1].punchline})
+    for _ in range(10):
+        status, body = service.respond('GET', '/joke?about=Chicken')
+        assert status == 200 and body['id'] in (0, 2)
+    assert service.respond('GET', '/joke?about=chicken+road')[1]['id'] == 0
+
+    assert service.respond('GET', '/joke?about=horse')[0] == 404
+    assert service.respond('GET', '/joke/3')[0] == 404
+    assert service.respond('GET', '/jokes')[0] == 404
+    assert service.respond('POST', '/joke')[0] == 405
+    assert JokeService([]).respond('GET', '/joke')[0] == 404
+
+
+async def round_trip(service):
+    server = await asyncio.start_server(lambda r, w: handle_client(service, r, w), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"GET /joke/2 HTTP/1.1\r\nHost: x\r\n\r\nGET /joke HTTP/1.1\r\nConnection: close\r\n\r\n")
+        data = await reader.read()  # Both answers on one connection, then closed by the server
+        writer.close()
+        load = await run_load('127.0.0.1', port, connections=5, requests=50)
+    return data, load
+
+
+def test_server_keeps_connections_alive():
+    data, load = asyncio.run(round_trip(JokeService(JOKES)))
+    first, second = data.split(b"HTTP/1.1 ")[1:]
+    assert first.startswith(b"200 OK") and b"Connection: keep-alive" in first
+    assert json.loads(first.split(b"\r\n\r\n", 1)[1])['id'] == 2
+    assert b"Connection: close" in second
+    assert (load['requests'], load['errors']) == (50, 0)
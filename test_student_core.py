@@ -0,0 +1,408 @@
+"""Tests for student_core"""
+import os
+import random
+import time
+
+import pytest
+
+from student_core import (CodeIndex, FIELDS, SearchIndex, StudentColumns, StudentDatabase, StudentJournal,
+                          apply_change, calculate_percentage, cohort_statistics, format_statistics,
+                          format_student_line, load_students, main, merge_marks_files, parse_student_line,
+                          percentage_rank, read_snapshot, read_student_chunks, select_top_codes,
+                          snapshot_path, total_marks, write_students)
+
+STUDENTS = [
+    {'code': 1001, 'name': 'John Smith', 'coursework1': 15, 'coursework2': 18, 'coursework3': 17, 'exam': 75},
+    {'code': 1002, 'name': 'Emily Johnson', 'coursework1': 19, 'coursework2': 20, 'coursework3': 18, 'exam': 88},
+    {'code': 1003, 'name': 'Michael Brown', 'coursework1': 12, 'coursework2': 14, 'coursework3': 13, 'exam': 62},
+]
+
+NEW_STUDENT = {'code': 1004, 'name': 'Sarah Davis', 'coursework1': 17, 'coursework2': 16, 'coursework3': 18,
+               'exam': 79}
+
+
+@pytest.fixture
+def marks_file(tmp_path):
+    filename = str(tmp_path / 'studentMarks.txt')
+    write_students(filename, STUDENTS)
+    return filename
+
+
+def loaded(filename, **options):
+    db = StudentDatabase(filename, **options)
+    assert db.load() == []
+    return db
+
+
+def by_code(db):
+    return {student['code']: dict(student) for student in db.students}
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_journal_changes_are_replayed_on_load(marks_file, compact):
+    db = loaded(marks_file, journal=True, compact=compact)
+    for action, student in [('A', NEW_STUDENT), ('U', dict(STUDENTS[0], exam=100)), ('D', {'code': 1002})]:
+        apply_change(db, action, student)
+        db.save_change(action, student)
+
+    # The marks file is untouched; the changes live only in the journal
+    with open(marks_file) as file:
+        assert file.read() == "3\n" + "".join(map(format_student_line, STUDENTS))
+    reloaded = loaded(marks_file, journal=True, compact=compact)
+    assert by_code(reloaded) == by_code(db)
+    assert reloaded.get_by_code(1001)['exam'] == 100
+    assert reloaded.get_by_code(1002) is None
+
+
+def test_torn_journal_tail_is_cut_off(marks_file):
+    db = loaded(marks_file, journal=True)
+    db.add_record(NEW_STUDENT)
+    db.save_change('A', NEW_STUDENT)
+    journal_path = marks_file + '.journal'
+    good_size = os.path.getsize(journal_path)
+
+    with open(journal_path, 'ab') as file:
+        file.write(b"0badc0de,U,1001,John Sm")  # A write cut short by a crash
+
+    reloaded = loaded(marks_file, journal=True)
+    assert reloaded.get_by_code(1004) == NEW_STUDENT
+    assert reloaded.get_by_code(1001) == STUDENTS[0]
+    assert os.path.getsize(journal_path) == good_size
+
+
+def test_journal_left_by_a_journal_run_is_folded_in_by_a_plain_run(marks_file):
+    db = loaded(marks_file, journal=True)
+    db.add_record(NEW_STUDENT)
+    db.save_change('A', NEW_STUDENT)
+
+    assert loaded(marks_file).get_by_code(1004) == NEW_STUDENT
+    assert os.path.getsize(marks_file + '.journal') == 0
+    with open(marks_file) as file:
+        assert file.readline() == "4\n"
+
+
+
+def test_entry_with_a_bad_checksum_is_not_replayed(marks_file):
+    journal = StudentJournal(marks_file)
+    journal.append('A', NEW_STUDENT)
+    good_size = os.path.getsize(journal.path)
+    with open(journal.path, 'ab') as file:
+        file.write(b"00000000,D,1001\n")
+
+    db = loaded(marks_file, journal=True)
+    assert db.get_by_code(1001) == STUDENTS[0] and db.get_by_code(1004) == NEW_STUDENT
+    assert os.path.getsize(journal.path) == good_size
+
+
+def test_parse_rejects_codes_too_large_for_the_code_arrays():
+    with pytest.raises(ValueError):
+        parse_student_line("99999999999,Too Big,1,1,1,1")
+    assert parse_student_line("42,Small Code,1,1,1,1")['code'] == 42
+
+
+def test_marks_file_is_streamed_in_chunks_and_bad_lines_are_reported(tmp_path):
+    filename = str(tmp_path / 'marks.txt')
+    with open(filename, 'w') as file:
+        file.write("4\n" + "".join(map(format_student_line, STUDENTS)) + "\n1005,No Marks\n99999999999,Too Big,1,1,1,1\n")
+    errors = []
+    chunks = list(read_student_chunks(filename, chunk_size=2, errors=errors))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert [student for chunk in chunks for student in chunk] == STUDENTS
+    assert [number for number, message in errors] == [6, 7, 1]  # The header count is checked last
+
+    for students in ([], StudentColumns()):
+        assert [dict(student) for student in load_students(filename, students, chunk_size=2)] == STUDENTS
+
+
+def test_snapshot_is_used_until_the_marks_file_changes(marks_file):
+    loaded(marks_file, snapshot=True)
+    snapshot = read_snapshot(marks_file)
+    assert snapshot is not None
+    assert [dict(student) for student in snapshot] == STUDENTS
+
+    # Touched without changing: the CRC still matches
+    later = time.time() + 5
+    os.utime(marks_file, (later, later))
+    assert read_snapshot(marks_file) is not None
+
+    write_students(marks_file, STUDENTS[:2] + [dict(STUDENTS[2], exam=63)])
+    assert read_snapshot(marks_file) is None
+    assert loaded(marks_file, snapshot=True).get_by_code(1003)['exam'] == 63
+    assert read_snapshot(marks_file) is not None  # Rebuilt by that load
+
+
+def test_truncated_snapshot_is_stale(marks_file):
+    loaded(marks_file, snapshot=True)
+    path = snapshot_path(marks_file)
+    with open(path, 'rb') as file:
+        data = file.read()
+    for size in range(0, len(data), 7):
+        with open(path, 'wb') as file:
+            file.write(data[:size])
+        assert read_snapshot(marks_file) is None
+    assert loaded(marks_file, snapshot=True).students.codes.tolist() == [1001, 1002, 1003]
+
+
+def test_search_index_insert_and_remove_match_a_fresh_build():
+    students = [dict(student) for student in STUDENTS]
+    index = SearchIndex.for_students(students)
+    assert index.search('smith') == [1001]
+    assert index.search('100') == [1001, 1002, 1003]
+
+    index.insert(NEW_STUDENT)
+    students.append(NEW_STUDENT)
+    assert index.search('davis') == [1004]
+    assert index.search('s') == [1004, 1001]  # 'sarah davis' sorts before 'smith'
+    fresh = SearchIndex.for_students(students)
+    assert (index.keys, index.codes) == (fresh.keys, fresh.codes)
+
+    index.remove(STUDENTS[0])
+    students.remove(STUDENTS[0])
+    assert index.search('smith') == []
+    assert index.search('john') == [1002]  # Only Emily Johnson's surname is left
+    fresh = SearchIndex.for_students(students)
+    assert (index.keys, index.codes) == (fresh.keys, fresh.codes)
+
+
+def test_search_follows_database_changes(marks_file):
+    db = loaded(marks_file, compact=True)
+    assert [s['code'] for s in db.search('brown')] == [1003]
+    db.update_record(dict(STUDENTS[2], name='Michael Green'))
+    assert db.search('brown') == []
+    assert [s['name'] for s in db.search('green')] == ['Michael Green']
+    assert [s['code'] for s in db.search('micheal', fuzzy=True)] == [1003]
+
+
+@pytest.mark.parametrize('options', [{}, {'journal': True}, {'compact': True}])
+def test_transaction_rolls_back_on_error(marks_file, options):
+    db = loaded(marks_file, **options)
+    before = by_code(db)
+    with pytest.raises(ValueError):
+        with db.transaction() as transaction:
+            transaction.add(NEW_STUDENT)
+            transaction.update(dict(STUDENTS[1], name='Emily Jones'))
+            transaction.delete(1003)
+            transaction.add(STUDENTS[0])  # Code already exists
+
+    assert by_code(db) == before
+    assert db.search('emily jones') == []
+    assert [s['code'] for s in db.search('emily')] == [1002]
+    assert by_code(loaded(marks_file, **options)) == before
+
+
+def test_rollback_of_an_uncommitted_transaction(marks_file):
+    db = loaded(marks_file)
+    transaction = db.transaction()
+    transaction.delete(1001)
+    transaction.add(NEW_STUDENT)
+    assert len(db.students) == 3 and db.get_by_code(1001) is None
+    transaction.rollback()
+    assert by_code(db) == by_code(loaded(marks_file))
+    assert len(transaction) == 0
+
+
+def test_transaction_is_journalled_as_one_group(marks_file):
+    db = loaded(marks_file, journal=True)
+    with db.transaction() as transaction:
+        transaction.add(NEW_STUDENT)
+        transaction.update(dict(STUDENTS[0], exam=100))
+        transaction.delete(1002)
+    assert by_code(loaded(marks_file, journal=True)) == by_code(db)
+
+    # Only the first of a later group of two changes reached the disk: none of it is replayed
+    journal_path = marks_file + '.journal'
+    good_size = os.path.getsize(journal_path)
+    StudentJournal(marks_file).append_many([('D', STUDENTS[0]), ('D', STUDENTS[2])])
+    with open(journal_path, 'r+b') as file:
+        lines = file.read()[good_size:].splitlines(keepends=True)
+        file.truncate(good_size + len(lines[0]) + len(lines[1]))
+    reloaded = loaded(marks_file, journal=True)
+    assert reloaded.get_by_code(1001)['exam'] == 100 and reloaded.get_by_code(1003) == STUDENTS[2]
+    assert os.path.getsize(journal_path) == good_size
+
+
+def test_columns_behave_like_the_list_of_dicts():
+    columns = StudentColumns.from_records(STUDENTS)
+    assert len(columns) == 3 and list(columns) == STUDENTS
+    assert columns[-1] == STUDENTS[-1]
+
+    columns.append(NEW_STUDENT)
+    columns[0] = dict(STUDENTS[0], exam=10)
+    del columns[1]
+    assert [student['code'] for student in columns] == [1001, 1003, 1004]
+    assert columns[0]['exam'] == 10
+
+    assert list(columns.totals()) == [sum(student[field] for field in FIELDS[2:]) for student in columns]
+    assert columns.percentages() == [calculate_percentage(student) for student in columns]
+    assert columns[columns.index_of_highest()]['code'] == 1004
+    assert columns[columns.index_of_lowest()]['code'] == 1001
+
+
+def test_code_index_delete_moves_the_last_record_into_the_gap():
+    students = [dict(student) for student in STUDENTS]
+    index = CodeIndex(students)
+    index.add(NEW_STUDENT)
+    with pytest.raises(KeyError):
+        index.add(STUDENTS[1])
+    assert index.get(1003) == STUDENTS[2] and index.get(9999) is None
+
+    assert index.delete(1001) == STUDENTS[0]
+    assert [student['code'] for student in students] == [1004, 1002, 1003]
+    assert index.positions == {1004: 0, 1002: 1, 1003: 2}
+    index.delete(1003)  # Already the last row
+    assert [student['code'] for student in students] == [1004, 1002]
+    assert index.deletions == 2 and len(index) == 2 and 1003 not in index
+
+
+def test_metrics_are_cached_until_the_student_changes(marks_file):
+    db = loaded(marks_file)
+    student = db.get_by_code(1001)
+    first = db.metrics.get(student)
+    assert db.metrics.get(student) is first
+    assert (db.metrics.hits, db.metrics.misses, db.metrics.hit_rate()) == (1, 1, 0.5)
+    assert first.percentage == calculate_percentage(student)
+
+    db.update_record(dict(student, exam=100))
+    assert db.calculate_percentage(db.get_by_code(1001)) == calculate_percentage(dict(student, exam=100))
+    assert db.metrics.misses == 2
+    db.delete_by_code(1001)
+    assert 1001 not in db.metrics.values
+
+
+def sorted_by_hand(db, key, reverse=False):
+    sort_key = {'percentage': calculate_percentage, 'total': total_marks,
+                'name': lambda student: student['name'], 'code': lambda student: student['code']}[key]
+    return [student['code'] for student in sorted(db.students, key=sort_key, reverse=reverse)]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_sorted_views_stay_current_after_changes(marks_file, compact):
+    db = loaded(marks_file, compact=compact)
+    for key in ('percentage', 'name', 'code', 'total'):
+        db.sorted_codes(key)  # Build every view before changing anything
+    db.add_record(NEW_STUDENT)
+    db.update_record(dict(STUDENTS[1], name='Adam Young', exam=10))
+    db.delete_by_code(1003)
+
+    for key in ('percentage', 'name', 'code', 'total'):
+        for reverse in (False, True):
+            assert db.sorted_codes(key, reverse) == sorted_by_hand(db, key, reverse)
+    assert [student['code'] for student in db.sorted_students('name', limit=2)] == [1002, 1001]
+    assert [student['code'] for student in db.sorted_view('code', reverse=True)] == [1004, 1002, 1001]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_top_bottom_and_rank_agree_with_a_full_sort(marks_file, compact):
+    db = loaded(marks_file, compact=compact)
+    db.add_record(NEW_STUDENT)
+    db.add_record(dict(NEW_STUDENT, code=1005, name='Tied Davis'))
+    best_first = [1002, 1004, 1005, 1001, 1003]
+    for views in (False, True):  # Heap selection first, then the sorted view once it exists
+        if views:
+            db.sorted_codes('percentage')
+        assert [student['code'] for student in db.top_students(2)] == best_first[:2]
+        assert [student['code'] for student in db.bottom_students(2)] == [1003, 1001]
+        assert [student['code'] for student in db.bottom_percent(50)] == [1003, 1001, 1005]
+        assert [db.rank_of(code) for code in best_first] == [1, 2, 2, 4, 5]  # Equal marks share a rank
+        assert db.rank_of(9999) is None
+
+    assert select_top_codes(STUDENTS, 1, lowest=True) == [1003]
+    assert percentage_rank(STUDENTS, STUDENTS[0]) == 2
+
+
+def student_numbers(output):
+    return [int(line.split(': ')[1]) for line in output.splitlines() if line.startswith("Student Number:")]
+
+
+def test_cli_reads_and_changes_the_marks_file(marks_file, tmp_path, capsys):
+    assert main(['--file', marks_file, 'top', '-n', '2']) == 0
+    assert student_numbers(capsys.readouterr().out) == [1002, 1001]
+
+    assert main(['--file', marks_file, 'add', '1004', 'Sarah Davis', '17', '16', '18', '79']) == 0
+    assert main(['--file', marks_file, 'delete', '1001']) == 0
+    capsys.readouterr()
+    assert main(['--file', marks_file, 'sort', '--by', 'name']) == 0
+    assert student_numbers(capsys.readouterr().out) == [1002, 1003, 1004]
+    assert by_code(loaded(marks_file)) == {1002: STUDENTS[1], 1003: STUDENTS[2], 1004: NEW_STUDENT}
+
+    changes = tmp_path / 'changes.txt'
+    changes.write_text("# Rolled back: the second change fails\nU,1002,Emily Jones,19,20,18,88\nD,1001\n")
+    assert main(['--file', marks_file, 'batch', str(changes)]) == 1
+    assert "No student with code 1001" in capsys.readouterr().err
+    assert loaded(marks_file).get_by_code(1002) == STUDENTS[1]
+
+
+@pytest.mark.parametrize('policy, exams, conflicts', [
+    ('newest', {1001: 50, 1002: 88}, []),
+    ('highest', {1001: 90, 1002: 88}, []),
+    ('report', {1001: 90, 1002: 88}, [(1001, 'older', 'newer')]),
+])
+def test_merge_policies_settle_duplicate_codes(tmp_path, policy, exams, conflicts):
+    older = str(tmp_path / 'older.txt')
+    newer = str(tmp_path / 'newer.txt')
+    write_students(older, [dict(STUDENTS[0], exam=90), STUDENTS[1]])
+    with open(newer, 'w') as file:
+        file.write("2\n" + format_student_line(dict(STUDENTS[0], exam=50)) + format_student_line(STUDENTS[1]))
+        file.write("1003,Bad Line\n")
+    os.utime(older, (1000, 1000))
+    os.utime(newer, (2000, 2000))
+
+    students, found, errors = merge_marks_files([older, newer], policy, workers=2)
+    assert {student['code']: student['exam'] for student in students} == exams
+    assert [(code, os.path.basename(kept)[:-4], os.path.basename(dropped)[:-4])
+            for code, kept, dropped in found] == conflicts
+    assert [(filename, number) for filename, number, _ in errors] == [(newer, 4)]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_statistics_match_a_direct_computation(compact):
+    students = STUDENTS + [NEW_STUDENT]
+    stats = cohort_statistics(StudentColumns.from_records(students) if compact else students)
+    percentages = sorted(calculate_percentage(student) for student in students)
+    mean = sum(percentages) / len(percentages)
+
+    assert stats['count'] == 4
+    assert stats['mean'] == pytest.approx(mean)
+    assert stats['std'] == pytest.approx((sum((p - mean) ** 2 for p in percentages) / 4) ** 0.5)
+    assert stats['median'] == pytest.approx((percentages[1] + percentages[2]) / 2)
+    assert stats['percentiles'][25] == pytest.approx(percentages[0] + 0.75 * (percentages[1] - percentages[0]))
+    assert (stats['min'], stats['max']) == (percentages[0], percentages[-1])
+    assert sum(stats['grades'].values()) == 4
+    assert stats['components']['exam']['histogram'][88] == 1
+    assert stats['components']['coursework1']['mean'] == pytest.approx((15 + 19 + 12 + 17) / 4)
+
+    report = format_statistics(stats)
+    assert "Number of students: 4\n" in report and "60-69: 1\n" in report
+    assert cohort_statistics([]) is None and format_statistics(None) == "No student records found.\n"
+
+
+def random_cohort(count, seed):
+    rng = random.Random(seed)
+    codes = rng.sample(range(1000, 9999), count)  # Not in code order, so ties are broken by code, not position
+    return [{'code': code, 'name': rng.choice(['Ann Lee', 'Bob Ray', 'Cy Dunn', 'Di Moss']),
+             'coursework1': rng.randint(0, 20), 'coursework2': rng.randint(0, 20),
+             'coursework3': rng.randint(0, 20), 'exam': rng.randint(0, 100)} for code in codes]
+
+
+def test_sqlite_queries_agree_with_the_in_memory_indexes(tmp_path):
+    filename = str(tmp_path / 'marks.txt')
+    cohort = random_cohort(300, 11)
+    write_students(filename, cohort)
+    memory = loaded(filename)
+    sql = loaded(filename, sqlite=True)
+    for db in (memory, sql):
+        changes = [('A', NEW_STUDENT), ('D', {'code': cohort[0]['code']})]
+        for action, student in changes:
+            apply_change(db, action, student)
+        db.save_changes(changes)
+    assert sql.use_sql() and by_code(sql) == by_code(memory)
+
+    # Heap selection first, before the sorted views exist
+    assert sql.top_students(20) == memory.top_students(20)
+    assert sql.bottom_students(20) == memory.bottom_students(20)
+    for key in ('percentage', 'name', 'code', 'total'):
+        for reverse in (False, True):
+            assert sql.sorted_codes(key, reverse, limit=50) == memory.sorted_codes(key, reverse, limit=50)
+    for low, high in [(0, 100), (40, 60), (49.5, 50.4), (55.1, 55.2)]:
+        assert sql.percentage_range(low, high) == memory.percentage_range(low, high)
+    assert [sql.rank_of(code) for code in by_code(sql)] == [memory.rank_of(code) for code in by_code(sql)]